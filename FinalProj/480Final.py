@@ -1,4 +1,6 @@
 import collections
+import contextlib
+import io
 import time
 import numpy as np
 import seaborn as sns
@@ -7,7 +9,12 @@ from matplotlib import pyplot as plt
 import mmh3
 import os
 import pandas as pd
-import csv
+import bisect
+from heavyHitters import ClusterHeavyHitters, HotKeyDetector
+from traceReader import readColumn
+from traceCache import loadCache
+from requestTable import RequestTable
+import spoca
 SEED=480
 DATASIZE=5000
 
@@ -21,52 +28,498 @@ testingFile=os.path.join(currDir, "Datasets","DS1","TestingHistory.csv")
 dSet=os.path.join(currDir,"Datasets","dataset.csv")
 
 """
-Represents a server in the consistent hash ring.
+Represents the state of every server in one pool as columns instead of per-server Python lists.
+
+Attributes:
+    - capacity, occupancy, overload (numpy arrays): Per-server capacity, requests held and rejected inserts.
+    - alive (numpy array): False while a server is full.
+    - member (numpy array): False for servers that were deleted from the pool.
+    - head (numpy array): Per-server offset of the oldest request still held; expired requests sit before it.
+    - buffers (list): Per-server int32 arrays of request ids, grown on demand up to the server capacity (twice that once requests expire).
+    - views (list): The Server of every row.
+    - decayed, stamp (numpy arrays): Per-server exponentially decayed load and the time it was last brought up to date.
+    - halfLife (float): Seconds after which a request counts for half in decayed, None to skip the decayed load.
+    - table (RequestTable): Interns the requests stored in the buffers.
+
+Methods:
+    - addServer(capacity, server): Adds a row for a new server and returns its index.
+    - push(index, request): Stores a request on a server, returns False if the server is full.
+    - pushMany(index, batch): Stores a batch already known to fit.
+    - expire(index, count): Drops a server's count oldest requests.
+    - decay(index, count, now): Adds count requests made at time now to a server's decayed load.
+    - decayedLoad(now): Returns every server's decayed load at time now.
+    - idsOf(index): Returns the request ids a server holds.
+    - requestsOf(index): Returns the request strings a server holds.
+    - release(index): Frees a deleted server's buffer.
+    - nbytes(): Returns the memory held by the columns and buffers.
+"""
+class ClusterState:
+    def __init__(self, table=None):
+        self.capacity=np.zeros(0,dtype=np.int64)
+        self.occupancy=np.zeros(0,dtype=np.int64)
+        self.overload=np.zeros(0,dtype=np.int64)
+        self.alive=np.zeros(0,dtype=bool)
+        self.member=np.zeros(0,dtype=bool)
+        self.head=np.zeros(0,dtype=np.int64)
+        self.decayed=np.zeros(0,dtype=np.float64)
+        self.stamp=np.zeros(0,dtype=np.float64)
+        self.halfLife=None
+        self.buffers=[]
+        self.views=[]
+        self.table=RequestTable(SEED) if table is None else table
+
+    def addServer(self, capacity, server=None):
+        index=len(self.buffers)
+        self.capacity=np.append(self.capacity,capacity)
+        self.occupancy=np.append(self.occupancy,0)
+        self.overload=np.append(self.overload,0)
+        self.alive=np.append(self.alive,True)
+        self.member=np.append(self.member,True)
+        self.head=np.append(self.head,0)
+        self.decayed=np.append(self.decayed,0.0)
+        self.stamp=np.append(self.stamp,0.0)
+        # nothing is allocated for requests until the server takes one
+        self.buffers.append(np.zeros(0,dtype=np.int32))
+        self.views.append(server)
+        return index
+
+    def reserve(self, index, size):
+        # size counts from the head, which only moves once requests expire
+        buffer=self.buffers[index]
+        head=self.head.item(index)
+        if head+size<=len(buffer):
+            return
+        used=self.occupancy.item(index)
+        if head and head>=used:
+            # at least as many requests expired as are held, so moving the held ones down is paid for by those expiries
+            buffer[:used]=buffer[head:head+used]
+            self.head[index]=head=0
+            if size<=len(buffer):
+                return
+        limit=self.capacity.item(index)*(2 if head else 1)
+        grown=np.zeros(min(limit,max(head+size,2*len(buffer),16)),dtype=np.int32)
+        grown[:len(buffer)]=buffer
+        self.buffers[index]=grown
+
+    def push(self, index, request):
+        requestId=self.table.intern(request)
+        # empty requests were never counted against capacity, so they are accepted and dropped
+        if self.table.names[requestId]=="":
+            return True
+        used=self.occupancy.item(index)
+        if used>=self.capacity.item(index):
+            self.alive[index]=False
+            self.overload[index]+=1
+            return False
+        self.reserve(index,used+1)
+        self.buffers[index][self.head.item(index)+used]=requestId
+        self.occupancy[index]=used+1
+        if used+1>=self.capacity.item(index):
+            self.alive[index]=False
+        return True
+
+    def pushMany(self, index, batch):
+        # the caller has already checked the batch fits
+        batch=[requestId for requestId in map(self.table.intern,batch) if self.table.names[requestId]!=""]
+        used=self.occupancy.item(index)
+        self.reserve(index,used+len(batch))
+        head=self.head.item(index)
+        self.buffers[index][head+used:head+used+len(batch)]=batch
+        self.occupancy[index]=used+len(batch)
+        if used+len(batch)>=self.capacity.item(index):
+            self.alive[index]=False
+
+    def expire(self, index, count):
+        # requests are held oldest first, so the ones that expire are always at the head
+        used=self.occupancy.item(index)
+        count=min(count,used)
+        self.head[index]=0 if count==used else self.head.item(index)+count
+        self.occupancy[index]=used-count
+        self.alive[index]=self.member.item(index) and used-count<self.capacity.item(index)
+
+    def decay(self, index, count, now):
+        elapsed=now-self.stamp.item(index)
+        self.decayed[index]=self.decayed.item(index)*0.5**(elapsed/self.halfLife)+count
+        self.stamp[index]=now
+
+    def decayedLoad(self, now):
+        return self.decayed*0.5**((now-self.stamp)/self.halfLife)
+
+    def idsOf(self, index):
+        head=self.head.item(index)
+        return self.buffers[index][head:head+self.occupancy.item(index)]
+
+    def requestsOf(self, index):
+        return [self.table.names[requestId] for requestId in self.idsOf(index)]
+
+    def release(self, index):
+        self.member[index]=False
+        self.alive[index]=False
+        self.occupancy[index]=0
+        self.head[index]=0
+        self.buffers[index]=np.zeros(0,dtype=np.int32)
+
+    def nbytes(self):
+        columns=self.capacity.nbytes+self.occupancy.nbytes+self.overload.nbytes+self.alive.nbytes+self.member.nbytes
+        columns+=self.head.nbytes+self.decayed.nbytes+self.stamp.nbytes
+        return columns+sum(buffer.nbytes for buffer in self.buffers)
+
+"""
+Represents a server in the consistent hash ring. A Server is a view onto its row of a ClusterState.
 
 Attributes:
     - name (str): The name or identifier of the server.
-    - requests (list): A list of requests made to the server.
+    - state (ClusterState): The columns holding this server's counters and requests.
+    - index (int): This server's row in state.
+    - capacity, used (int): Read from state.
+    - dead (bool): Set as soon as the server is full.
+    - requests (list): The requests held, rebuilt from their interned ids.
 
 Methods:
     - add_request(request): Adds a request to the server.
+    - add_requests(batch): Adds a batch of requests already known to fit.
+    - numRequests(): Returns the number of requests held.
+    - freeSlots(): Returns the remaining capacity.
+    - isFull(): Returns True once the server has reached capacity.
     - display_requests(): Displays the server's requests.
     
 """
 class Server:
-    def __init__(self, name,capacity):
+    __slots__=("name","state","index")
+
+    def __init__(self, name,capacity,state=None):
         self.name = name
-        self.requests = [""]
-        self.capacity=capacity
-        self.requests = [""]*self.capacity
-        
-        self.dead=False
+        self.state=ClusterState() if state is None else state
+        self.index=self.state.addServer(capacity,self)
 
-  
-    def numRequests(self):
+    @property
+    def capacity(self):
+        return self.state.capacity.item(self.index)
+
+    @property
+    def used(self):
+        return self.state.occupancy.item(self.index)
+
+    @property
+    def dead(self):
+        return not self.state.alive.item(self.index)
 
-        c=0
-        for request in self.requests:
-            if request!="":
-                c+=1
-        return c
+    @dead.setter
+    def dead(self, value):
+        self.state.alive[self.index]=not value
+
+    @property
+    def requests(self):
+        return self.state.requestsOf(self.index)
+
+    def numRequests(self):
+        return self.used
+    def freeSlots(self):
+        return self.capacity-self.used
+    def isFull(self):
+        return self.used>=self.capacity
     def add_request(self, request):
-        if self.numRequests()<self.capacity:
-            
-            self.requests.append(request)
-            return True
-        else:
-            self.dead=True
-            return False
+        return self.state.push(self.index,request)
+
+    def add_requests(self, batch):
+        # the caller has already checked the batch fits in freeSlots()
+        self.state.pushMany(self.index,batch)
             
 
     def display_requests(self):
-        c=0
-        for request in self.requests:
-            if request!="":
-                c+=1
-        print(f"Capacity for Server {self.name}: {c}/{self.capacity} ")
+        print(f"Capacity for Server {self.name}: {self.used}/{self.capacity} ")
         
 
+"""
+Represents a hashed timer wheel of expiry times. Each slot covers resolution seconds and counts, per server index,
+the requests expiring in it, so scheduling and expiring are O(1) per request however long the trace is.
+
+Attributes:
+    - resolution (float): Seconds covered by one slot.
+    - slots (list): Counter of server index to requests expiring, per slot.
+    - tick (int): Last slot already expired.
+
+Methods:
+    - schedule(expiry, index, count): Records count requests of a server expiring at time expiry.
+    - advance(now): Returns a Counter of server index to the requests that expired up to time now.
+"""
+class TimerWheel:
+    def __init__(self, resolution, size):
+        self.resolution=resolution
+        self.slots=[collections.Counter() for x in range(size)]
+        self.tick=0
+
+    def schedule(self, expiry, index, count=1):
+        # expiries are at most one ttl ahead, which the slots cover, and never land in a slot already expired
+        tick=max(math.ceil(expiry/self.resolution),self.tick+1)
+        self.slots[tick%len(self.slots)][index]+=count
+
+    def advance(self, now):
+        target=math.floor(now/self.resolution)
+        due=collections.Counter()
+        # a jump longer than the wheel visits every slot once
+        for tick in range(self.tick+1,self.tick+1+min(target-self.tick,len(self.slots))):
+            slot=tick%len(self.slots)
+            if self.slots[slot]:
+                due.update(self.slots[slot])
+                self.slots[slot]=collections.Counter()
+        self.tick=max(self.tick,target)
+        return due
+
+"""
+    Shared bookkeeping for every routing engine: the server set, the running health totals and the bulk admission used by route_batch.
+
+Attributes:
+    - servers (set): The Server instances currently in the pool.
+    - requestTable (RequestTable): Interned requests and their cached hashes, can be shared between pools.
+    - state (ClusterState): Columns holding every server's counters and requests.
+    - usedCapacity, totalCapacity (int): Running totals over the servers in the pool.
+    - deadServers, activeServers, aliveServers (int): Running server health counts.
+    - lastBatchTime (float): Seconds taken by the most recent route_batch call.
+    - heavyHitters (ClusterHeavyHitters): Streaming heavy-hitter counts of every placed request, None to skip them.
+    - clock (float): Latest request timestamp seen, it never moves backwards.
+    - ttl (float): Seconds a placed request is held before it expires, None to hold requests forever.
+    - wheel (TimerWheel): Expiry times of the held requests, per server.
+    - deferSchedule (bool): Set while routeRuns places a run, whose expiries and decay are then recorded at each request's own timestamp.
+
+ Methods:
+    - add_multiple_Servers(number): Adds multiple servers to the pool.
+    - add_newRequest(request, timestamp): Routes a request made at timestamp and returns the time it took, or False if no server took it.
+    - schedule(server, count, moment): Records the expiry and decayed load of count requests placed on a server at moment (the clock by default).
+    - setExpiry(ttl, halfLife, wheelSlots): Makes requests expire after ttl seconds and/or keeps a decayed load with the given half-life.
+    - advanceClock(timestamp): Moves the clock forward and expires every request whose ttl has run out.
+    - routeRuns(requests, timestamps, minRun): Places a timestamped batch as runs that share one wheel slot, advancing the clock before each run; runs shorter than minRun are routed one request at a time.
+    - serverPositions(slots): Maps what routeRequest returned to serverList positions, which for most engines it already is.
+    - scheduleRun(placed, moments): Schedules the requests a run placed (serverList positions) at the moment each one was made.
+    - reopen(): Called after requests expire, for engines that cache which servers have room.
+    - decayedLoads(): Returns the decayed load of every server, in serverList order.
+    - placeRequest(server, request): Adds a request to a server and updates the running totals.
+    - placeRequests(server, batch): Same as placeRequest for a batch that fits.
+    - admitBatch(requests, owners, slotServers, slotIds): Places requests whose first-choice slots are already known.
+    - occupancyVector(): Returns the requests held by every server, in serverList order.
+    - display_ring(): Displays every server along with the health totals.
+    """
+
+class ServerPool:
+    def __init__(self, servers=None, requestTable=None):
+        self.servers=set() if servers is None else servers
+        self.totalReq=0
+        self.totalServer=0
+        self.usedCapacity=0
+        self.totalCapacity=0
+        self.deadServers=0
+        self.activeServers=0
+        self.aliveServers=0
+        self.lastBatchTime=0
+        self.requestTable=RequestTable(SEED) if requestTable is None else requestTable
+        self.state=ClusterState(self.requestTable)
+        self.heavyHitters=None
+        self.clock=0
+        self.ttl=None
+        self.wheel=None
+        self.deferSchedule=False
+
+    def add_multiple_Servers(self, number,capacity):
+        for x in range(number):
+            self.add_Server(f"Server{x}",capacity)
+
+    def trackServer(self, server, sign):
+        # adds (sign=1) or withdraws (sign=-1) a server's share of the running totals
+        self.usedCapacity+=sign*server.numRequests()
+        if server.isFull():
+            self.deadServers+=sign
+        if server.dead==False:
+            self.aliveServers+=sign
+            if server.numRequests()>0:
+                self.activeServers+=sign
+
+    def placeRequest(self, server, request):
+        self.trackServer(server,-1)
+        before=server.used
+        placed=server.add_request(request)
+        self.trackServer(server,1)
+        if placed:
+            self.totalReq+=1
+            if not self.deferSchedule:
+                self.schedule(server,server.used-before)
+            if self.heavyHitters is not None:
+                self.heavyHitters.record(server.name,server.capacity,self.requestTable.intern(request))
+        return placed
+
+    def placeRequests(self, server, batch):
+        self.trackServer(server,-1)
+        before=server.used
+        server.add_requests(batch)
+        self.trackServer(server,1)
+        self.totalReq+=len(batch)
+        if not self.deferSchedule:
+            self.schedule(server,server.used-before)
+        if self.heavyHitters is not None:
+            self.heavyHitters.recordMany(server.name,server.capacity,[self.requestTable.intern(request) for request in batch])
+
+    def schedule(self, server, count, moment=None):
+        if moment is None:
+            moment=self.clock
+        if self.wheel is not None and count:
+            self.wheel.schedule(moment+self.ttl,server.index,count)
+        if self.state.halfLife is not None and count:
+            self.state.decay(server.index,count,moment)
+
+    def setExpiry(self, ttl=None, halfLife=None, wheelSlots=256):
+        self.ttl=ttl
+        self.wheel=None if ttl is None else TimerWheel(float(ttl)/wheelSlots,wheelSlots+2)
+        self.state.halfLife=halfLife
+
+    def advanceClock(self, timestamp):
+        if timestamp<=self.clock:
+            return
+        self.clock=timestamp
+        if self.wheel is None:
+            return
+        due=self.wheel.advance(timestamp)
+        for index,count in due.items():
+            server=self.state.views[index]
+            # a deleted server already gave up its requests
+            if not self.state.member.item(index):
+                continue
+            self.trackServer(server,-1)
+            self.state.expire(index,count)
+            self.trackServer(server,1)
+        if due:
+            self.reopen()
+
+    def reopen(self):
+        pass
+
+    def serverPositions(self, slots):
+        return slots
+
+    def routeRuns(self, requests, timestamps, minRun=16):
+        start=time.time()
+        if isinstance(requests,np.ndarray):
+            requests=requests.tolist()
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        if len(requests)==0:
+            return placed
+        # a timestamp behind the clock counts as the clock, the same as in add_newRequest
+        moments=np.maximum.accumulate(np.maximum(np.asarray(timestamps,dtype=np.float64),self.clock))
+        if self.wheel is None:
+            bounds=[0,len(requests)]
+        else:
+            # nothing expires inside one wheel slot, so a run sees the occupancy sequential routing would
+            ticks=np.floor(moments/self.wheel.resolution)
+            bounds=[0]+(np.flatnonzero(np.diff(ticks))+1).tolist()+[len(requests)]
+        slots=np.full(len(requests),-1,dtype=np.int64)
+        for begin,end in zip(bounds[:-1],bounds[1:]):
+            if end-begin<minRun:
+                # the batch set-up costs more than a short run saves, and one at a time is the sequential walk itself
+                for x in range(begin,end):
+                    self.advanceClock(float(moments[x]))
+                    slot=self.routeRequest(requests[x])
+                    if slot is not None:
+                        slots[x]=slot
+                continue
+            self.advanceClock(float(moments[begin]))
+            self.deferSchedule=True
+            placed[begin:end]=self.route_batch(requests[begin:end])
+            self.deferSchedule=False
+            self.scheduleRun(placed[begin:end],moments[begin:end])
+            self.advanceClock(float(moments[end-1]))
+        routed=slots>=0
+        if routed.any():
+            placed[routed]=self.serverPositions(slots[routed])
+        self.lastBatchTime=time.time()-start
+        return placed
+
+    def scheduleRun(self, placed, moments):
+        if self.wheel is None and self.state.halfLife is None:
+            return
+        hit=placed>=0
+        rows=np.array([server.index for server in self.serverList()],dtype=np.int64)[placed[hit]]
+        # requests placed on one server at one moment are recorded together, in time order so the decay matches
+        pairs,counts=np.unique(np.column_stack((moments[hit],rows)),axis=0,return_counts=True)
+        for (moment,row),count in zip(pairs.tolist(),counts.tolist()):
+            self.schedule(self.state.views[int(row)],count,moment)
+
+    def decayedLoads(self):
+        return self.state.decayedLoad(self.clock)[[server.index for server in self.serverList()]]
+
+    def admitBatch(self, requests, owners, slotServers, slotIds):
+        # owners[i] is the slot request i hashes to; a full slot hands over to the next slot with room,
+        # which is the walk routeRequest does one request at a time
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        servers=list(dict.fromkeys(slotServers))
+        position={server:i for i,server in enumerate(servers)}
+        # several slots can share one server (virtual nodes), so capacity is checked per server
+        serverOf=np.array([position[server] for server in slotServers],dtype=np.int64)
+        rows=np.array([server.index for server in servers],dtype=np.int64)
+        x=0
+        while x<len(requests):
+            free=self.state.capacity[rows]-self.state.occupancy[rows]
+            openSlots=np.flatnonzero(free[serverOf]>0)
+            if len(openSlots)==0:
+                break
+            target=openSlots[np.searchsorted(openSlots,owners[x:])%len(openSlots)]
+            owner=serverOf[target]
+            order=np.argsort(owner,kind="stable")
+            sortedOwner=owner[order]
+            rank=np.empty(len(owner),dtype=np.int64)
+            rank[order]=np.arange(len(owner))-np.searchsorted(sortedOwner,sortedOwner)
+            overflow=np.flatnonzero(rank>=free[owner])
+            end=overflow[0] if len(overflow) else len(owner)
+            # everything before the first overflow lands where the sequential walk would put it
+            admitted=order[order<end]
+            if len(admitted):
+                groups=np.split(admitted,np.flatnonzero(np.diff(owner[admitted]))+1)
+                for group in groups:
+                    self.placeRequests(servers[owner[group[0]]],[requests[x+i] for i in group])
+                placed[x+admitted]=slotIds[target[admitted]]
+            x+=end
+            if x<len(requests):
+                # this request finds its server freshly filled, so it walks on alone
+                slot=self.routeRequest(requests[x])
+                if slot is not None:
+                    placed[x]=slot
+                x+=1
+        return placed
+
+    def calculate_load_distribution(self):
+        return float(self.usedCapacity)/self.totalCapacity
+
+    def occupancyVector(self):
+        return self.state.occupancy[[server.index for server in self.serverList()]]
+        
+
+    def get_total_requests(self):
+        return self.totalReq
+
+    def get_total_servers(self):
+        return self.totalServer
+
+    def get_dead_servers(self):
+        return self.deadServers
+    def get_active_servers(self):
+        return self.activeServers
+    def get_alive_servers(self):
+        return self.aliveServers
+
+    def add_newRequest(self, request, timestamp=None):
+        start=time.time()
+        if timestamp is not None:
+            self.advanceClock(timestamp)
+        if self.routeRequest(request) is None:
+            return False
+        end=time.time()
+        return end-start
+
+    def display_ring(self):
+        for server in self.serverList():
+            server.display_requests()
+        print(f"Dead Servers: {self.get_dead_servers()} ")
+        print(f"Active Servers: {self.get_active_servers()} ")
+        print(f"Alive Servers: {self.get_alive_servers()} ")
+
+
 """
     Represents a consistent hash ring for distributing servers and requests.
 
@@ -75,22 +528,52 @@ Attributes:
     - ring (list): A list representing the hash ring, with each element containing either an empty string or a Server instance.
     - servers (list): A list containing Server instances.
     - requests (list): A list containing requests to be distributed in the hash ring.
+    - indexed (bool): Resolve requests through the sorted token index instead of scanning the ring slot by slot.
+    - tokens (list): Sorted ring positions currently occupied by a server.
+    - vnodes (int): Ring positions given to each server.
+    - capacityPerVnode (int): When set, a server gets one position per capacityPerVnode of capacity instead of vnodes.
+    - serverTokens (dict): Server name to the ring positions it occupies.
+    - loadFactor (float): When set (epsilon), a server only takes a request while it is below loadCap, otherwise the request moves on to the next server.
+    - choices (int): Ring positions (hashed with SEED, SEED+1, ...) a request compares before taking the least loaded one.
+    - affinity (OrderedDict): Most recent slot of up to affinitySize requests, so a repeated request returns to the same server.
+    - replicas (int): Servers, in successor order, a hot request is spread over; 1 turns replication off.
+    - hotKeys (HotKeyDetector): Decides which requests are hot, a request is hot at hotShare of its server's capacity within about hotWindow requests.
 
  Methods:
-    - add_multiple_Servers(number): Adds multiple servers to the hash ring.
-    - add_Server(Server_name): Adds a server to the hash ring.
+    - add_Server(Server_name): Adds a server to the hash ring, returns False if the ring has no free position left.
+    - vnodeCount(capacity): Returns how many ring positions a server of that capacity gets.
+    - loadCap(server): Returns ceil((1+loadFactor) * average load) for a server, the average scaled by its share of the total capacity.
+    - admits(server): Returns True if a server can take another request.
+    - chooseSlot(request): Returns the least loaded of the request's choices, or its remembered slot.
+    - remember(request, slot): Records a request's slot in the affinity map.
+    - replicaSlots(request): Returns the slots of the first replicas distinct servers from the request's position.
+    - chooseReplica(slots): Returns the least loaded of the replica slots that can take a request.
+    - serverList(): Returns each server once, in ring order.
     - add_newRequest(request): Adds a request to the hash ring.
+    - routeRequest(request): Places a request through the token index and returns the slot of the server that took it.
+    - route_batch(requests, timestamps): Places a whole list or array of requests (made at timestamps, if given) and returns the serverList position of the server each one landed on (-1 if none).
+    - serverPositions(slots): Maps ring slots to the serverList position of the server holding them.
+    - successor(key): Returns the index in tokens of the first server at or after key.
     - display_ring(): Displays the hash ring along with the requests associated with each server.
     """
 
-class ConsistentHashRing:
-    def __init__(self, totalNodes, servers=set(), requests=[]):
+class ConsistentHashRing(ServerPool):
+    def __init__(self, totalNodes, servers=None, requests=[], indexed=True, vnodes=1, capacityPerVnode=None, loadFactor=None, choices=1, affinitySize=1024, replicas=1, hotShare=0.1, hotWindow=10000, requestTable=None):
+        ServerPool.__init__(self,servers,requestTable)
         self.totalNodes=totalNodes
         self.ring=[""]*self.totalNodes
-        self.servers=servers
         self.requests=requests
-        self.totalReq=0
-        self.totalServer=0
+        self.indexed=indexed
+        self.tokens=[]
+        self.vnodes=vnodes
+        self.capacityPerVnode=capacityPerVnode
+        self.serverTokens={}
+        self.loadFactor=loadFactor
+        self.choices=choices
+        self.affinity=collections.OrderedDict()
+        self.affinitySize=affinitySize
+        self.replicas=replicas
+        self.hotKeys=HotKeyDetector(hotShare,hotWindow,keyOf=self.requestTable.hash64) if replicas>1 else None
         
         # for server in self.servers:
         #     key=mmh3.hash(server,SEED)%self.totalNodes
@@ -103,41 +586,54 @@ class ConsistentHashRing:
         #     while self.ring[key]=="":
         #         key+=1
         #     self.ring[key].add_request(request)
-    def add_multiple_Servers(self, number,capacity):
-        for x in range(number):
-            self.add_Server(f"Server{x}",capacity)
+
+    def vnodeCount(self, capacity):
+        if self.capacityPerVnode:
+            return max(1,math.ceil(capacity/self.capacityPerVnode))
+        return self.vnodes
 
     def add_Server(self, Server_name,capacity):
-        
-        newServer=Server(Server_name,capacity)
-        key=mmh3.hash(newServer.name,SEED)%self.totalNodes
-        while self.ring[key]!="":
-            key+=math.ceil(self.totalNodes/16)
+        if len(self.tokens)==self.totalNodes:
+            return False
+        newServer=Server(Server_name,capacity,self.state)
+        slots=[]
+        for v in range(self.vnodeCount(capacity)):
+            # a full ring stops handing out positions, the server keeps the ones it already has
+            if len(self.tokens)==self.totalNodes:
+                break
+            # the first position keeps the plain server name so single-token rings place servers as before
+            key=mmh3.hash(newServer.name if v==0 else f"{newServer.name}#{v}",SEED)%self.totalNodes
+            probes=0
+            while self.ring[key]!="":
+                probes+=1
+                key=(key+(math.ceil(self.totalNodes/16) if probes<=16 else 1))%self.totalNodes
+            self.ring[key]=newServer
+            bisect.insort(self.tokens,key)
+            slots.append(key)
+        self.serverTokens[newServer.name]=slots
         self.totalServer+=1
-        self.ring[key]=newServer
-        temp=[]
-        for server in self.ring:
-            if server!="":
-                for x in range (math.ceil(self.totalNodes/self.totalServer)):
-                    
-                    tempReq=server.requests[x]
-                    temp.append(tempReq)
-                    newServer.add_request(tempReq)
+        # requests already placed stay where they are, the old copy loop only ever carried the empty prefill
         self.servers.add(newServer)
-        
-        
+        self.totalCapacity+=newServer.capacity
+        self.trackServer(newServer,1)
+        return True
 
     def delete_Server(self,Server_name):
-        key=mmh3.hash(Server_name,SEED)%self.totalNodes
+        slots=self.serverTokens.pop(Server_name,[])
         
         temp=[]
         
-        if self.ring[key].name==Server_name:
-            
-            
-            temp=self.ring[key].requests
-            
-            self.ring[key]=""
+        if slots:
+            server=self.ring[slots[0]]
+            temp=server.requests
+            self.totalCapacity-=server.capacity
+            self.trackServer(server,-1)
+            self.state.release(server.index)
+            self.servers.discard(server)
+            self.totalServer-=1
+            for key in slots:
+                self.ring[key]=""
+                del self.tokens[bisect.bisect_left(self.tokens,key)]
         
         
         for req in range (len(temp)):
@@ -147,59 +643,157 @@ class ConsistentHashRing:
             
     
             
-    def calculate_load_distribution(self):
-        used_capacity=0
-        total_capacity=0
-
-        for server in self.ring:
-            if server!="":
-                used_capacity+=server.numRequests()
-                total_capacity+=server.capacity
-        
-        return float(used_capacity)/total_capacity
-        
-
-    def get_total_requests(self):
-        return self.totalReq
-
-    def get_total_servers(self):
-        return self.totalServer
-
-    def get_dead_servers(self):
-        dead=0
-        for server in self.ring:
-            if isinstance(server,Server):
-                if server.numRequests()==server.capacity:
-                    server.dead=True
-                    dead+=1
-        return dead
-    def get_active_servers(self):
-        not_dead=0
-        for server in self.ring:
-            if isinstance(server,Server):
-                if server.dead==False and server.numRequests()>0:
-                    not_dead+=1
-        return not_dead
-    def get_alive_servers(self):
-        not_dead=0
-        for server in self.ring:
-            if isinstance(server,Server):
-                if server.dead==False:
-                    
-                    not_dead+=1
-        return not_dead
-    def add_newRequest(self, request):
+    def serverList(self):
+        return list(dict.fromkeys(self.ring[key] for key in self.tokens))
+
+    def successor(self, key):
+        # first occupied position at or after key, wrapping past the end of the ring
+        return bisect.bisect_left(self.tokens,key)%len(self.tokens)
+
+    def loadCap(self, server):
+        # the request being placed counts towards the average, so an empty ring still admits it
+        return math.ceil((1+self.loadFactor)*(self.usedCapacity+1)*server.capacity/self.totalCapacity)
+
+    def admits(self, server):
+        return server.dead==False and (self.loadFactor is None or server.numRequests()<self.loadCap(server))
+
+    def chooseSlot(self, request):
+        slot=self.affinity.get(request)
+        if slot is not None and self.ring[slot]!="" and self.admits(self.ring[slot]):
+            return slot
+        best=None
+        for i in range(self.choices):
+            key=self.requestTable.hash32(request) if i==0 else mmh3.hash(self.requestTable.name(request),SEED+i)
+            index=self.successor(key%self.totalNodes)
+            # each choice is the first server on its walk that can take the request
+            for x in range(len(self.tokens)):
+                server=self.ring[self.tokens[index]]
+                if self.admits(server):
+                    load=server.numRequests()/server.capacity
+                    if best is None or load<bestLoad:
+                        best=self.tokens[index]
+                        bestLoad=load
+                    break
+                index=(index+1)%len(self.tokens)
+        return best
+
+    def remember(self, request, slot):
+        self.affinity[request]=slot
+        self.affinity.move_to_end(request)
+        if len(self.affinity)>self.affinitySize:
+            self.affinity.popitem(last=False)
+
+    def replicaSlots(self, request):
+        index=self.successor(self.requestTable.hash32(request)%self.totalNodes)
+        slots=[]
+        seen=set()
+        for x in range(len(self.tokens)):
+            server=self.ring[self.tokens[index]]
+            if server.name not in seen:
+                seen.add(server.name)
+                slots.append(self.tokens[index])
+                if len(slots)==self.replicas:
+                    break
+            index=(index+1)%len(self.tokens)
+        return slots
+
+    def chooseReplica(self, slots):
+        best=None
+        for slot in slots:
+            server=self.ring[slot]
+            if self.admits(server):
+                load=server.numRequests()/server.capacity
+                if best is None or load<bestLoad:
+                    best=slot
+                    bestLoad=load
+        return best
+
+    def routeRequest(self, request):
+        if self.get_alive_servers()==0:
+            return None
+        request=self.requestTable.intern(request)
+        if self.replicas>1:
+            slots=self.replicaSlots(request)
+            # a hot request is spread over its replicas, once it cools down it goes back to its own server
+            if self.hotKeys.observe(request,self.ring[slots[0]].capacity):
+                slot=self.chooseReplica(slots)
+                if slot is not None and self.placeRequest(self.ring[slot],request):
+                    return slot
+        if self.choices>1:
+            slot=self.chooseSlot(request)
+            if slot is not None and self.placeRequest(self.ring[slot],request):
+                self.remember(request,slot)
+                return slot
+        index=self.successor(self.requestTable.hash32(request)%self.totalNodes)
+        fallback=None
+        # every server is tried at most once, so a full ring can not spin forever
+        for x in range(len(self.tokens)):
+            server=self.ring[self.tokens[index]]
+            if server.dead==False:
+                if self.admits(server):
+                    if self.placeRequest(server,request):
+                        return self.tokens[index]
+                elif fallback is None:
+                    fallback=index
+            index=(index+1)%len(self.tokens)
+        # every live server is at its cap (dead servers took more than their share), so the first one with room takes it
+        if fallback is not None and self.placeRequest(self.ring[self.tokens[fallback]],request):
+            return self.tokens[fallback]
+        return None
+
+    def route_batch(self, requests, timestamps=None):
+        if timestamps is not None:
+            return self.routeRuns(requests,timestamps)
+        start=time.time()
+        if isinstance(requests,np.ndarray):
+            requests=requests.tolist()
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        if len(requests)==0 or len(self.tokens)==0:
+            return placed
+        if self.loadFactor is not None or self.choices>1 or self.replicas>1:
+            # the cap, the least loaded choice and the hot set move with every placement, so these modes admit one at a time
+            for x in range(len(requests)):
+                slot=self.routeRequest(requests[x])
+                if slot is not None:
+                    placed[x]=slot
+            placed=self.serverPositions(placed)
+            self.lastBatchTime=time.time()-start
+            return placed
+        ids=self.requestTable.internAll(requests)
+        requests=ids.tolist()
+        keys=self.requestTable.hashes32[ids]%self.totalNodes
+        tokens=np.array(self.tokens,dtype=np.int64)
+        owners=np.searchsorted(tokens,keys)%len(tokens)
+        placed=self.serverPositions(self.admitBatch(requests,owners,[self.ring[token] for token in self.tokens],tokens))
+        self.lastBatchTime=time.time()-start
+        return placed
+
+    def serverPositions(self, slots):
+        # a server owns several slots with vnodes, so batches report the server the way the other engines do
+        position={server.name:i for i,server in enumerate(self.serverList())}
+        owner=np.array([position[self.ring[token].name] for token in self.tokens],dtype=np.int64)
+        placed=np.asarray(slots,dtype=np.int64).copy()
+        hit=placed>=0
+        placed[hit]=owner[np.searchsorted(self.tokens,placed[hit])]
+        return placed
+
+    def add_newRequest(self, request, timestamp=None):
         start=time.time()
         
+        if self.indexed or self.loadFactor is not None or self.replicas>1:
+            return ServerPool.add_newRequest(self,request,timestamp)
+        if timestamp is not None:
+            self.advanceClock(timestamp)
+
         if self.get_alive_servers()>0:
 
-            key=mmh3.hash(request,SEED)%self.totalNodes
+            key=self.requestTable.hash32(request)%self.totalNodes
             while self.ring[key]=="" :
             
 
                     key+=1
                     key=key%self.totalNodes
-            while self.ring[key].add_request(request)==False:
+            while self.placeRequest(self.ring[key],request)==False:
                
                 key+=1
                 key=key%self.totalNodes
@@ -213,17 +807,502 @@ class ConsistentHashRing:
             return end-start
         else:
             return False
-        
-    def display_ring(self):
-        for x in range(self.totalNodes):
-            
-            if self.ring[x]!="":
-                
-                self.ring[x].display_requests()
-        print(f"Dead Servers: {self.get_dead_servers()} ")
-        print(f"Active Servers: {self.get_active_servers()} ")
-        print(f"Alive Servers: {self.get_alive_servers()} ")
-    
+
+
+"""
+    Represents a pool routed with jump consistent hashing, so no slot array is kept and a lookup is O(log S) in the number of servers.
+
+Attributes:
+    - buckets (list): Server instances in bucket order; a request's jump hash is an index into this list.
+    - servers (set): The Server instances currently in the pool.
+
+ Methods:
+    - add_Server(Server_name, capacity): Appends a server as the next bucket.
+    - delete_Server(Server_name): Moves the last bucket into the deleted server's place and re-routes its requests.
+    - serverList(): Returns the servers in bucket order.
+    - requestKey(request): Returns the 64-bit key a request is jumped with.
+    - jumpHash(key, buckets): Returns the bucket a key lands in out of buckets.
+    - jumpBatch(keys, buckets): Same as jumpHash for a numpy array of keys.
+    - routeRequest(request): Places a request and returns the bucket of the server that took it.
+    - route_batch(requests, timestamps): Places a whole list or array of requests (made at timestamps, if given) and returns the bucket each one landed on (-1 if none).
+    """
+
+class JumpHashRing(ServerPool):
+    def __init__(self, totalNodes=0, servers=None, requestTable=None):
+        # totalNodes is accepted so the class can stand in for ConsistentHashRing; jump hashing needs no slots
+        ServerPool.__init__(self,servers,requestTable)
+        self.totalNodes=totalNodes
+        self.buckets=[]
+
+    def add_Server(self, Server_name,capacity):
+        newServer=Server(Server_name,capacity,self.state)
+        # requests already placed stay where they are, the same as on the ring
+        self.buckets.append(newServer)
+        self.servers.add(newServer)
+        self.totalServer+=1
+        self.totalCapacity+=newServer.capacity
+        self.trackServer(newServer,1)
+
+    def delete_Server(self,Server_name):
+        for index,server in enumerate(self.buckets):
+            if server.name==Server_name:
+                break
+        else:
+            return
+        temp=server.requests
+        self.totalCapacity-=server.capacity
+        self.trackServer(server,-1)
+        self.state.release(server.index)
+        self.servers.discard(server)
+        self.totalServer-=1
+        # jump hashing only shrinks from the end, so the last bucket takes over the freed index
+        self.buckets[index]=self.buckets[-1]
+        self.buckets.pop()
+        for req in temp:
+            self.add_newRequest(req)
+
+    def serverList(self):
+        return list(self.buckets)
+
+    def requestKey(self, request):
+        return self.requestTable.hash64(request)
+
+    def jumpHash(self, key, buckets):
+        b=-1
+        j=0
+        while j<buckets:
+            b=j
+            key=(key*2862933555777941757+1)&0xFFFFFFFFFFFFFFFF
+            j=int((b+1)*(float(1<<31)/float((key>>33)+1)))
+        return b
+
+    def jumpBatch(self, keys, buckets):
+        keys=keys.copy()
+        b=np.full(len(keys),-1,dtype=np.int64)
+        j=np.zeros(len(keys),dtype=np.int64)
+        active=np.flatnonzero(j<buckets)
+        while len(active):
+            b[active]=j[active]
+            keys[active]=keys[active]*np.uint64(2862933555777941757)+np.uint64(1)
+            j[active]=((b[active]+1)*(float(1<<31)/((keys[active]>>np.uint64(33)).astype(np.float64)+1))).astype(np.int64)
+            active=active[j[active]<buckets]
+        return b
+
+    def routeRequest(self, request):
+        if self.get_alive_servers()==0:
+            return None
+        index=self.jumpHash(self.requestKey(request),len(self.buckets))
+        # a full bucket hands the request to the next bucket, trying each server once
+        for x in range(len(self.buckets)):
+            server=self.buckets[index]
+            if server.dead==False and self.placeRequest(server,request):
+                return index
+            index=(index+1)%len(self.buckets)
+        return None
+
+    def route_batch(self, requests, timestamps=None):
+        if timestamps is not None:
+            return self.routeRuns(requests,timestamps)
+        start=time.time()
+        if isinstance(requests,np.ndarray):
+            requests=requests.tolist()
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        if len(requests)==0 or len(self.buckets)==0:
+            return placed
+        ids=self.requestTable.internAll(requests)
+        requests=ids.tolist()
+        owners=self.jumpBatch(self.requestTable.hashes64[ids],len(self.buckets))
+        placed=self.admitBatch(requests,owners,self.buckets,np.arange(len(self.buckets)))
+        self.lastBatchTime=time.time()-start
+        return placed
+
+
+"""
+    Represents a pool routed with weighted rendezvous (highest random weight) hashing. Every server scores each request
+    and the highest scoring server with room takes it, so losing a server only moves the requests that server held.
+
+Attributes:
+    - members (list): Server instances in join order; scores and choices are indexes into this list.
+    - seeds (numpy array): Per-server 64-bit seed mixed with the request key.
+    - weights (numpy array): Per-server weight, the server capacity.
+    - open (numpy array): True for servers that still have room.
+    - position (dict): Server name to its index in members.
+
+ Methods:
+    - add_Server(Server_name, capacity): Adds a server to the pool.
+    - delete_Server(Server_name): Removes a server and re-routes only the requests it held.
+    - reindex(): Rebuilds the name to index map after the member list changes.
+    - reopen(): Recomputes open after requests expire.
+    - serverList(): Returns the servers in join order.
+    - requestKey(request): Returns the 64-bit key a request is scored with.
+    - scores(keys, seeds, weights): Returns the weighted score of every key against every seed.
+    - choose(key): Returns the index of the best open server for a key, or -1 if none is open.
+    - chooseBatch(keys): Same as choose for a numpy array of keys.
+    - routeRequest(request): Places a request and returns the index of the server that took it.
+    - route_batch(requests, timestamps): Places a whole list or array of requests (made at timestamps, if given) and returns the index each one landed on (-1 if none).
+    """
+
+class RendezvousRing(ServerPool):
+    def __init__(self, totalNodes=0, servers=None, requestTable=None):
+        ServerPool.__init__(self,servers,requestTable)
+        self.totalNodes=totalNodes
+        self.members=[]
+        self.seeds=np.zeros(0,dtype=np.uint64)
+        self.weights=np.zeros(0,dtype=np.float64)
+        self.open=np.zeros(0,dtype=bool)
+        self.reindex()
+
+    def add_Server(self, Server_name,capacity):
+        newServer=Server(Server_name,capacity,self.state)
+        self.members.append(newServer)
+        self.seeds=np.append(self.seeds,np.uint64(mmh3.hash64(newServer.name,SEED,signed=False)[0]))
+        self.weights=np.append(self.weights,float(newServer.capacity))
+        self.open=np.append(self.open,not newServer.dead)
+        self.reindex()
+        self.servers.add(newServer)
+        self.totalServer+=1
+        self.totalCapacity+=newServer.capacity
+        self.trackServer(newServer,1)
+
+    def delete_Server(self,Server_name):
+        index=self.position.get(Server_name)
+        if index is None:
+            return
+        server=self.members.pop(index)
+        self.seeds=np.delete(self.seeds,index)
+        self.weights=np.delete(self.weights,index)
+        self.open=np.delete(self.open,index)
+        self.reindex()
+        temp=server.requests
+        self.totalCapacity-=server.capacity
+        self.trackServer(server,-1)
+        self.state.release(server.index)
+        self.servers.discard(server)
+        self.totalServer-=1
+        for req in temp:
+            self.add_newRequest(req)
+
+    def reindex(self):
+        self.position={member.name:i for i,member in enumerate(self.members)}
+
+    def reopen(self):
+        self.open=np.array([not member.dead for member in self.members],dtype=bool)
+        self.reindex()
+
+    def serverList(self):
+        return list(self.members)
+
+    def placeRequest(self, server, request):
+        placed=ServerPool.placeRequest(self,server,request)
+        if server.dead:
+            self.open[self.position[server.name]]=False
+        return placed
+
+    def requestKey(self, request):
+        return self.requestTable.hash64(request)
+
+    def scores(self, keys, seeds, weights):
+        # splitmix64 finaliser over key^seed, turned into u in (0,1) and weighted as weight/-ln(u)
+        z=np.bitwise_xor(np.asarray(keys,dtype=np.uint64)[:,None],seeds[None,:])
+        z=z+np.uint64(0x9E3779B97F4A7C15)
+        z=(z^(z>>np.uint64(30)))*np.uint64(0xBF58476D1CE4E5B9)
+        z=(z^(z>>np.uint64(27)))*np.uint64(0x94D049BB133111EB)
+        z=z^(z>>np.uint64(31))
+        u=((z>>np.uint64(11)).astype(np.float64)+0.5)/float(1<<53)
+        return weights[None,:]/-np.log(u)
+
+    def choose(self, key):
+        candidates=np.flatnonzero(self.open)
+        if len(candidates)==0:
+            return -1
+        return candidates[np.argmax(self.scores([key],self.seeds[candidates],self.weights[candidates])[0])]
+
+    def chooseBatch(self, keys):
+        candidates=np.flatnonzero(self.open)
+        if len(candidates)==0:
+            return np.full(len(keys),-1,dtype=np.int64)
+        choices=np.empty(len(keys),dtype=np.int64)
+        # score in row chunks so a batch against 1000 servers stays around a million floats
+        step=max(1,1000000//len(candidates))
+        for x in range(0,len(keys),step):
+            choices[x:x+step]=candidates[np.argmax(self.scores(keys[x:x+step],self.seeds[candidates],self.weights[candidates]),axis=1)]
+        return choices
+
+    def routeRequest(self, request):
+        if self.get_alive_servers()==0:
+            return None
+        index=self.choose(self.requestKey(request))
+        if index<0 or not self.placeRequest(self.members[index],request):
+            return None
+        return index
+
+    def route_batch(self, requests, timestamps=None):
+        if timestamps is not None:
+            return self.routeRuns(requests,timestamps)
+        start=time.time()
+        if isinstance(requests,np.ndarray):
+            requests=requests.tolist()
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        if len(requests)==0 or len(self.members)==0:
+            return placed
+        ids=self.requestTable.internAll(requests)
+        requests=ids.tolist()
+        keys=self.requestTable.hashes64[ids]
+        choices=self.chooseBatch(keys)
+        for x in range(len(requests)):
+            index=choices[x]
+            # a first choice that filled up earlier in the batch is re-scored against the servers still open
+            if index<0 or not self.open[index]:
+                index=self.choose(keys[x])
+            if index>=0 and self.placeRequest(self.members[index],requests[x]):
+                placed[x]=index
+        self.lastBatchTime=time.time()-start
+        return placed
+
+
+"""
+    Represents a rendezvous pool for large server counts. Servers are grouped into clusters of at most clusterSize;
+    a request first picks a cluster by rendezvous over the clusters (weighted by their capacity) and then a server
+    inside it, so a lookup scores about S/clusterSize + clusterSize servers instead of all S.
+
+Attributes:
+    - clusterSize (int): Most servers a cluster holds.
+    - clusterOf (numpy array): Cluster id of every member.
+    - clusterSeeds (numpy array): Per-cluster 64-bit seed.
+    - clusterMembers (list): Member indexes of every cluster.
+    - clusterWeights (numpy array): Total capacity of every cluster.
+    - clusterOpen (numpy array): Members of every cluster that still have room.
+
+ Methods:
+    - add_Server(Server_name, capacity): Adds a server to the smallest cluster, opening a new one when all are full.
+    - reindex(): Rebuilds the name to index map and the cluster tables after the member list changes.
+    - openMembers(cluster): Returns the members of a cluster that still have room.
+    - choose(key): Returns the index of the best open server in the best open cluster, or -1 if none is open.
+    - chooseBatch(keys): Same as choose for a numpy array of keys.
+    """
+
+class SkeletonRendezvousRing(RendezvousRing):
+    def __init__(self, totalNodes=0, servers=None, clusterSize=32, requestTable=None):
+        self.clusterSize=clusterSize
+        self.clusterOf=np.zeros(0,dtype=np.int64)
+        self.clusterSeeds=np.zeros(0,dtype=np.uint64)
+        RendezvousRing.__init__(self,totalNodes,servers,requestTable)
+
+    def add_Server(self, Server_name,capacity):
+        sizes=np.bincount(self.clusterOf,minlength=len(self.clusterSeeds))
+        if len(sizes)==0 or sizes.min()>=self.clusterSize:
+            cluster=len(self.clusterSeeds)
+            self.clusterSeeds=np.append(self.clusterSeeds,np.uint64(mmh3.hash64(f"cluster{cluster}",SEED,signed=False)[0]))
+        else:
+            cluster=int(np.argmin(sizes))
+        self.clusterOf=np.append(self.clusterOf,cluster)
+        RendezvousRing.add_Server(self,Server_name,capacity)
+
+    def delete_Server(self,Server_name):
+        index=self.position.get(Server_name)
+        if index is not None:
+            self.clusterOf=np.delete(self.clusterOf,index)
+        RendezvousRing.delete_Server(self,Server_name)
+
+    def reindex(self):
+        RendezvousRing.reindex(self)
+        # a cluster keeps its full capacity as weight while any member has room, so filling one
+        # server never changes which cluster the other requests pick
+        self.clusterMembers=[np.flatnonzero(self.clusterOf==cluster) for cluster in range(len(self.clusterSeeds))]
+        self.clusterWeights=np.bincount(self.clusterOf,weights=self.weights,minlength=len(self.clusterSeeds))
+        self.clusterOpen=np.bincount(self.clusterOf,weights=self.open,minlength=len(self.clusterSeeds)).astype(np.int64)
+
+    def placeRequest(self, server, request):
+        index=self.position[server.name]
+        wasOpen=self.open[index]
+        placed=RendezvousRing.placeRequest(self,server,request)
+        if wasOpen and not self.open[index]:
+            self.clusterOpen[self.clusterOf[index]]-=1
+        return placed
+
+    def openMembers(self, cluster):
+        members=self.clusterMembers[cluster]
+        return members[self.open[members]]
+
+    def choose(self, key):
+        clusters=np.flatnonzero(self.clusterOpen>0)
+        if len(clusters)==0:
+            return -1
+        cluster=clusters[np.argmax(self.scores([key],self.clusterSeeds[clusters],self.clusterWeights[clusters])[0])]
+        candidates=self.openMembers(cluster)
+        return candidates[np.argmax(self.scores([key],self.seeds[candidates],self.weights[candidates])[0])]
+
+    def chooseBatch(self, keys):
+        choices=np.full(len(keys),-1,dtype=np.int64)
+        clusters=np.flatnonzero(self.clusterOpen>0)
+        if len(clusters)==0:
+            return choices
+        picked=clusters[np.argmax(self.scores(keys,self.clusterSeeds[clusters],self.clusterWeights[clusters]),axis=1)]
+        for cluster in np.unique(picked):
+            rows=np.flatnonzero(picked==cluster)
+            candidates=self.openMembers(cluster)
+            choices[rows]=candidates[np.argmax(self.scores(keys[rows],self.seeds[candidates],self.weights[candidates]),axis=1)]
+        return choices
+
+
+"""
+    Returns True if n is prime, by trial division (table sizes are small enough for it).
+    """
+def isPrime(n):
+    if n<2:
+        return False
+    divisor=2
+    while divisor*divisor<=n:
+        if n%divisor==0:
+            return False
+        divisor+=1
+    return True
+
+"""
+    Represents a pool routed through a Maglev lookup table: a prime-sized table that maps a request hash straight
+    to a server, so placing a request is a single table read. The table is refilled from each server's cached
+    (offset, skip) permutation the first time it is read after servers joined or left, so a run of joins (adding
+    1,000 servers one by one) costs one rebuild instead of one per join.
+
+Attributes:
+    - tableSize (int): Number of table entries, a prime much larger than the server count; a composite size raises ValueError,
+      as a skip sharing a factor with it would only ever visit part of the table.
+    - members (list): Server instances in join order; table entries are indexes into this list.
+    - permutation (dict): Server name to its cached (offset, skip) pair.
+    - table (numpy array): Member index for every table entry, rebuilt on access when membership changed.
+    - lastDisruption (float): Fraction of table entries that changed server in the last rebuild, which covers every join and leave since the one before.
+    - stale (bool): True when membership changed since the table was last built.
+    - builtMembers (list): Members the current table was built for.
+
+ Methods:
+    - add_Server(Server_name, capacity): Adds a server, the table is rebuilt on its next read.
+    - delete_Server(Server_name): Removes a server and re-routes the requests it held.
+    - serverList(): Returns the servers in join order.
+    - refresh(): Rebuilds the table if membership changed.
+    - buildTable(): Refills the whole lookup table from the cached permutations and records lastDisruption.
+    - routeRequest(request): Places a request and returns the index of the server that took it.
+    - route_batch(requests, timestamps): Places a whole list or array of requests (made at timestamps, if given) and returns the index each one landed on (-1 if none).
+    """
+
+class MaglevRing(ServerPool):
+    def __init__(self, totalNodes=0, servers=None, tableSize=65537, requestTable=None):
+        if not isPrime(tableSize):
+            raise ValueError(f"tableSize {tableSize} is not prime, the Maglev permutations need a prime table")
+        ServerPool.__init__(self,servers,requestTable)
+        self.totalNodes=totalNodes
+        self.tableSize=tableSize
+        self.members=[]
+        self.permutation={}
+        self.lookup=np.zeros(0,dtype=np.int64)
+        self.disruption=0
+        self.builtMembers=[]
+        self.stale=False
+
+    def add_Server(self, Server_name,capacity):
+        newServer=Server(Server_name,capacity,self.state)
+        if newServer.name not in self.permutation:
+            offset=mmh3.hash(newServer.name,SEED,signed=False)%self.tableSize
+            skip=mmh3.hash(newServer.name,SEED+1,signed=False)%(self.tableSize-1)+1
+            self.permutation[newServer.name]=(offset,skip)
+        self.members.append(newServer)
+        self.stale=True
+        self.servers.add(newServer)
+        self.totalServer+=1
+        self.totalCapacity+=newServer.capacity
+        self.trackServer(newServer,1)
+
+    def delete_Server(self,Server_name):
+        for index,server in enumerate(self.members):
+            if server.name==Server_name:
+                break
+        else:
+            return
+        self.members.pop(index)
+        self.stale=True
+        temp=server.requests
+        self.totalCapacity-=server.capacity
+        self.trackServer(server,-1)
+        self.state.release(server.index)
+        self.servers.discard(server)
+        self.totalServer-=1
+        for req in temp:
+            self.add_newRequest(req)
+
+    def serverList(self):
+        return list(self.members)
+
+    @property
+    def table(self):
+        self.refresh()
+        return self.lookup
+
+    @property
+    def lastDisruption(self):
+        self.refresh()
+        return self.disruption
+
+    def refresh(self):
+        if self.stale:
+            self.buildTable()
+
+    def buildTable(self):
+        table=[-1]*self.tableSize
+        if self.members:
+            turns=[self.permutation[server.name] for server in self.members]
+            nexts=[0]*len(self.members)
+            filled=0
+            # members take turns claiming the next free entry of their own permutation until the table is full
+            while filled<self.tableSize:
+                for i,(offset,skip) in enumerate(turns):
+                    entry=(offset+nexts[i]*skip)%self.tableSize
+                    while table[entry]>=0:
+                        nexts[i]+=1
+                        entry=(offset+nexts[i]*skip)%self.tableSize
+                    table[entry]=i
+                    nexts[i]+=1
+                    filled+=1
+                    if filled==self.tableSize:
+                        break
+        previous=self.lookup
+        self.lookup=np.array(table,dtype=np.int64) if self.members else np.zeros(0,dtype=np.int64)
+        if len(previous)==0 or len(self.lookup)==0:
+            self.disruption=0
+        else:
+            # old member indexes are mapped to their current ones (-1 once gone), so shifted indexes do not count as moves
+            position={server.name:i for i,server in enumerate(self.members)}
+            remap=np.array([position.get(server.name,-1) for server in self.builtMembers],dtype=np.int64)
+            self.disruption=float(np.mean(remap[previous]!=self.lookup))
+        self.builtMembers=list(self.members)
+        self.stale=False
+
+    def routeRequest(self, request):
+        if self.get_alive_servers()==0:
+            return None
+        # the unsigned 32-bit hash is the cached signed one masked back to 32 bits
+        index=self.table[(self.requestTable.hash32(request)&0xFFFFFFFF)%self.tableSize]
+        # a full server hands the request to the next member, trying each server once
+        for x in range(len(self.members)):
+            server=self.members[index]
+            if server.dead==False and self.placeRequest(server,request):
+                return index
+            index=(index+1)%len(self.members)
+        return None
+
+    def route_batch(self, requests, timestamps=None):
+        if timestamps is not None:
+            return self.routeRuns(requests,timestamps)
+        start=time.time()
+        if isinstance(requests,np.ndarray):
+            requests=requests.tolist()
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        if len(requests)==0 or len(self.members)==0:
+            return placed
+        ids=self.requestTable.internAll(requests)
+        requests=ids.tolist()
+        owners=self.table[(self.requestTable.hashes32[ids]&0xFFFFFFFF)%self.tableSize]
+        placed=self.admitBatch(requests,owners,self.members,np.arange(len(self.members)))
+        self.lastBatchTime=time.time()-start
+        return placed
 
 
 
@@ -254,14 +1333,14 @@ class ConsistentHashRing:
 # ring.display_ring()
 
 
-all_requests = []
+"""
+    Streams one column of a dataset CSV and interns every value into table, so each distinct URL is hashed once.
+    Returns a numpy array with the request id of every row, up to limit rows; the strings are never held as a list.
+    """
+def load_requests(path, column, table, limit=DATASIZE):
+    return np.fromiter(map(table.intern,readColumn(path,column,limit)),dtype=np.int64)
 
-with open(dSet, 'r',errors="ignore") as file:
-    csv_reader = csv.reader(file)
-    for row in csv_reader:
-        if row:
-            if len(all_requests)<DATASIZE:
-                all_requests.append(row[2])
+requestTable=RequestTable(SEED)
 
 # print("WITH DS")
 # DsRing=ConsistentHashRing(totalNodes=5000)
@@ -274,11 +1353,16 @@ with open(dSet, 'r',errors="ignore") as file:
 
 # print(f"Load Distribution: {load_distribution}")
 
-print("expirement")
 
-def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_requests, threshold):
-    # Initialize ConsistentHashRing
-    ring = ConsistentHashRing(total_nodes)
+def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_requests, threshold, engine=ConsistentHashRing, timestamps=None, ttl=None, liveHeavyHitters=False):
+    # Initialize the routing engine (ConsistentHashRing, JumpHashRing, RendezvousRing, ...)
+    ring = engine(total_nodes, requestTable=requestTable)
+    # with a ttl, requests expire along the timestamps they were made at
+    ring.setExpiry(ttl)
+    # the sketches only ride along every placement when asked to, otherwise the held requests are summarised once at the end
+    if liveHeavyHitters:
+        ring.heavyHitters=ClusterHeavyHitters(keyOf=ring.requestTable.hash64)
+    label="CHBaseline" if engine is ConsistentHashRing else engine.__name__
 
     # Lists to store data for visualizations
     
@@ -290,7 +1374,6 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     health_status_data = []
     time_taken=[]
     latency=[]
-    timestamps=[]
   
     
     for i in range(num_servers//2):
@@ -304,7 +1387,7 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     
     print("adding req")
     for i in range(len(all_requests)):
-        time=(ring.add_newRequest(all_requests[i]))
+        time=(ring.add_newRequest(all_requests[i], None if timestamps is None else timestamps[i]))
         
         
         time_taken.append(time)
@@ -312,17 +1395,22 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
         deadServer.append(ring.get_dead_servers())
         active_servers_data.append(ring.get_active_servers())
         alive_servers_data.append(ring.get_alive_servers())
-        health_status_data.append([server.numRequests() for server in ring.ring if isinstance(server, Server)])
-        server_index = mmh3.hash(all_requests[i], SEED) % total_nodes
+        health_status_data.append(ring.occupancyVector().tolist())
+        server_index = ring.requestTable.hash32(all_requests[i]) % total_nodes
         latency.append((i,server_index,time_taken[i]))
     
     
 
+    if ring.heavyHitters is None:
+        ring.heavyHitters=ClusterHeavyHitters(keyOf=ring.requestTable.hash64)
+        for server in ring.serverList():
+            ring.heavyHitters.recordMany(server.name,server.capacity,server.state.idsOf(server.index).tolist())
+    # classified from the streaming sketches, so the same counts are available at any point of the replay
+    classes=ring.heavyHitters.classify(threshold)
     heavy_hitters_map={}
     infrequent_hitter_map={}
     for server in ring.servers:
-        heavy_hitters_map[server.name]=0
-        infrequent_hitter_map[server.name]=0
+        heavy_hitters_map[server.name],infrequent_hitter_map[server.name]=classes.get(server.name,(0,0))
 
 
     for server in ring.servers:
@@ -331,29 +1419,17 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
         if isinstance(server, Server):
     
             
-            countReq=collections.Counter(server.requests)
-            countReq.pop('')
-            for key,val in countReq.items():
-                if val>=threshold*server.capacity:
-                    
-                    heavy_hitters_map[server.name]+=1
-                 
-                else:
-                    
-                    infrequent_hitter_map[server.name]+=1
-                  
-                
-            
-            
+            # the most requested ids Space-Saving kept for this server, names are only looked up for the plot labels
+            topReq=ring.heavyHitters.servers[server.name].top() if server.name in ring.heavyHitters.servers else []
             
             plt.figure(figsize=(8, 5))
-            plt.bar(countReq.keys(), countReq.values())
+            plt.bar([ring.requestTable.name(key) for key,val in topReq], [val for key,val in topReq])
             plt.axhline(y=threshold*server.capacity, color='red', linestyle='--', label=f'Threshold ({threshold*server.capacity})')
             plt.title(f"Heavy Hitters for Server {server.name} total servers: {num_servers}, threshold{threshold}")
             plt.xlabel("Requests")                
             plt.ylabel("Request Count")
             plt.xticks(rotation=45, ha='right')
-            figure=os.path.join(currDir,"480FinalOutputs",f"CHBaseline-HHFS{server.name}_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
+            figure=os.path.join(currDir,"480FinalOutputs",f"{label}-HHFS{server.name}_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
             plt.savefig(figure)
             # plt.show()
             
@@ -368,7 +1444,7 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     plt.xlabel('Load Distribution')
     plt.ylabel('Dead Server')
     plt.legend()
-    figure=os.path.join(currDir,"480FinalOutputs",f"CHBaseline-SLOT_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
+    figure=os.path.join(currDir,"480FinalOutputs",f"{label}-SLOT_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
     plt.savefig(figure)
     # plt.show()
 
@@ -382,7 +1458,7 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     plt.xlabel('Iteration')
     plt.ylabel('Number of Servers')
     plt.legend()
-    figure=os.path.join(currDir,"480FinalOutputs",f"CHBaseline-SHSOI_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
+    figure=os.path.join(currDir,"480FinalOutputs",f"{label}-SHSOI_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
     plt.savefig(figure)
     # plt.show()
     health_status_per_server = list(zip(*health_status_data))
@@ -394,7 +1470,7 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     plt.title(f'Server Health Status Heatmap Over Iterations total servers: {num_servers}, threshold{threshold}')
     plt.xlabel('Iteration')
     plt.ylabel('Server Index')
-    figure=os.path.join(currDir,"480FinalOutputs",f"SHSHOI_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
+    figure=os.path.join(currDir,"480FinalOutputs",f"{label}-SHSHOI_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
     plt.savefig(figure)
     # plt.show()
 
@@ -404,7 +1480,7 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     plt.xlabel('Request Index')
     plt.ylabel('Time (seconds)')
     plt.grid(True)
-    figure=os.path.join(currDir,"480FinalOutputs",f"TVRI_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
+    figure=os.path.join(currDir,"480FinalOutputs",f"{label}-TVRI_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
     plt.savefig(figure)
     # plt.show()
 
@@ -435,19 +1511,73 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     ax.set_xticks(bar_positions)
     ax.set_xticklabels([f'Server {i}' for i in range(num_servers)])
     ax.legend()
-    figure=os.path.join(currDir,"480FinalOutputs",f"CHBaseline-COHHAIHFES_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
+    figure=os.path.join(currDir,"480FinalOutputs",f"{label}-COHHAIHFES_sNum{serverNum}_cap{server_capacity},thold{threshold}.png")
     plt.savefig(figure)
     # plt.show()
 
+"""
+    Returns the servers of any engine, SPOCA's from its own list where deleted servers stay (marked not alive).
+    """
+def poolServers(ring):
+    if isinstance(ring,spoca.ConsistentHashRing):
+        return [server for server in ring.servers if isinstance(server,spoca.Server)]
+    return ring.serverList()
+
+"""
+    Replays the DS1 training trace (from its binary cache) through each routing engine, SPOCA from spoca.py included, and prints,
+    per engine, the mean and 99th percentile time of routing a request and how many placements moved when one server is deleted.
+    """
+def benchmark_engines(total_nodes, num_servers, server_capacity, traceFile=trainingFile, engines=None):
+    if engines is None:
+        engines=[ConsistentHashRing,JumpHashRing,RendezvousRing,MaglevRing,spoca.ConsistentHashRing]
+    cache=loadCache(traceFile)
+    table=RequestTable(SEED)
+    trace=table.adopt(cache)[:DATASIZE]
+    results={}
+    for engine in engines:
+        isSpoca=engine is spoca.ConsistentHashRing
+        label="SPOCA" if isSpoca else engine.__name__
+        # SPOCA hashes with its own seed, so it interns the trace into a table of its own; its servers default is a shared list
+        ring=engine(total_nodes, servers=[], requestTable=RequestTable(spoca.SEED)) if isSpoca else engine(total_nodes, requestTable=table)
+        requests=ring.requestTable.adopt(cache)[:DATASIZE] if isSpoca else trace
+        for i in range(num_servers//2):
+            ring.add_Server(f"Server{i}", server_capacity[0])
+        for x in range(num_servers//2,num_servers):
+            ring.add_Server(f"Server{x}", server_capacity[1])
+        timings=[]
+        for request in requests:
+            # routeRequest is what add_newRequest times, without the line SPOCA prints per request
+            start=time.time()
+            if ring.routeRequest(request) is not None:
+                timings.append(time.time()-start)
+        before={server.name:collections.Counter(server.requests) for server in poolServers(ring)}
+        with contextlib.redirect_stdout(io.StringIO()):
+            ring.delete_Server("Server0")
+        moved=0
+        for server in poolServers(ring):
+            after=collections.Counter(server.requests)
+            after.subtract(before[server.name])
+            moved+=sum(count for request,count in after.items() if request!="" and count>0)
+        held=sum(count for request,count in before["Server0"].items() if request!="")
+        results[label]=(np.mean(timings),np.percentile(timings,99),moved,held)
+        print(f"{label}: mean {np.mean(timings)*1e6:.1f}us p99 {np.percentile(timings,99)*1e6:.1f}us moved {moved} (Server0 held {held})")
+    return results
+
+#benchmark_engines(total_nodes=1000, num_servers=10, server_capacity=[100,1000])
+
 #visualization_from_dataset(total_nodes=50000, num_servers=9, server_capacity=[50,500], all_requests=all_requests, threshold=0.15)
 
-serverNum=[10,20,50]
-threshold=[0.1,0.25,0.5]
-server_cap=[[100,1000],[500,5000]]
-for x in serverNum:
-    for y in threshold:
-        for z in server_cap:
-            visualization_from_dataset(total_nodes=1000, num_servers=x, server_capacity=z, all_requests=all_requests, threshold=y)
+# the experiments only run as a script, so the engines can be imported by the tests next to this file
+if __name__=="__main__":
+    all_requests = load_requests(dSet, 2, requestTable)
+    print("expirement")
+    serverNum=[10,20,50]
+    threshold=[0.1,0.25,0.5]
+    server_cap=[[100,1000],[500,5000]]
+    for x in serverNum:
+        for y in threshold:
+            for z in server_cap:
+                visualization_from_dataset(total_nodes=1000, num_servers=x, server_capacity=z, all_requests=all_requests, threshold=y)
 
 
 
@@ -0,0 +1,32 @@
+import math
+import random
+
+"""
+Represents the keep-relevant admission rule: a server rejects a request with probability
+((requests held - copies of this request held ** matchPower) / capacity) ** exponent, so requests a server already
+holds are kept together. Any object with the same admit(server, request, randomNum) method can stand in for it;
+servers only need numRequests(), matchingRequests(request) and capacity.
+
+Attributes:
+    - exponent (float): Power the unrelated share of the server is raised to.
+    - matchPower (float): Power the number of matching copies is raised to before it is subtracted.
+
+Methods:
+    - rejectProbability(server, request): Returns the chance the server turns the request away, in O(1).
+    - admit(server, request, randomNum): Returns True if the server takes the request, drawing randomNum when it is not given.
+"""
+class KeepRelevantPolicy:
+    def __init__(self, exponent=1, matchPower=1):
+        self.exponent=exponent
+        self.matchPower=matchPower
+
+    def rejectProbability(self, server, request):
+        return math.pow(float(server.numRequests()-math.pow(server.matchingRequests(request),self.matchPower))/server.capacity, self.exponent)
+
+    def admit(self, server, request, randomNum=None):
+        # an empty server always admits and does not consume a random draw
+        if server.numRequests()==0:
+            return True
+        if randomNum is None:
+            randomNum=random.uniform(0, 1)
+        return randomNum>=self.rejectProbability(server,request)
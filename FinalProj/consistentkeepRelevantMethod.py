@@ -7,8 +7,9 @@ from matplotlib import pyplot as plt
 import mmh3
 import os
 import pandas as pd
-import csv
 import random
+from traceReader import readColumn
+from admissionPolicy import KeepRelevantPolicy
 SEED=480
 DATASIZE=10000
 
@@ -27,39 +28,51 @@ Represents a server in the consistent hash ring.
 Attributes:
     - name (str): The name or identifier of the server.
     - requests (list): A list of requests made to the server.
+    - used (int): Number of real (non-empty) requests held, kept up to date on every insert.
+    - dead (bool): Set as soon as the server is full.
+    - counts (Counter): Copies of every request held, including the empty prefill, kept up to date on every insert.
+    - policy (KeepRelevantPolicy): Decides whether a request that is not forced is admitted.
 
 Methods:
     - add_request(request): Adds a request to the server.
+    - numRequests(): Returns the number of requests held.
+    - freeSlots(): Returns the remaining capacity.
+    - isFull(): Returns True once the server has reached capacity.
+    - countRequest(request): Updates the counters after a request is stored.
+    - matchingRequests(matchRequest): Returns how many copies of a request the server holds.
     - display_requests(): Displays the server's requests.
     
 """
 class Server:
-    def __init__(self, name,capacity):
+    def __init__(self, name,capacity,policy=None):
         self.name = name
         self.requests = [""]
         self.capacity=capacity
         self.requests = [""]*self.capacity
-        
+        self.counts=collections.Counter({"":self.capacity})
+        self.used=0
         self.dead=False
+        self.policy=KeepRelevantPolicy(exponent=2, matchPower=1) if policy is None else policy
 
   
     def numRequests(self):
-
-        c=0
-        for request in self.requests:
-            if request!="":
-                c+=1
-        return c
+        return self.used
+    def freeSlots(self):
+        return self.capacity-self.used
+    def isFull(self):
+        return self.used>=self.capacity
+    def countRequest(self, request):
+        self.counts[request]+=1
+        if request!="":
+            self.used+=1
+            if self.used>=self.capacity:
+                self.dead=True
     def matchingRequests(self, matchRequest):
-        c=0
-        for request in self.requests:
-            if request==matchRequest:
-                c+=1
-        return c
+        return self.counts[matchRequest]
     def add_request(self, request, force):
         randomNum=random.uniform(0, 1)
-        if not force and randomNum < math.pow(float(self.numRequests()-self.matchingRequests(request))/self.capacity, 2):
-            print("rejected here value was "+str(math.pow(float(self.numRequests()-self.matchingRequests(request))/self.capacity, 2)))
+        if not force and not self.policy.admit(self, request, randomNum):
+            print("rejected here value was "+str(self.policy.rejectProbability(self, request)))
             print(randomNum)
             print(self.numRequests())
             print(self.matchingRequests(request))
@@ -68,6 +81,7 @@ class Server:
         if self.numRequests()<self.capacity:
             # print("not rejected!")
             self.requests.append(request)
+            self.countRequest(request)
             return True
         else:
             self.dead=True
@@ -75,11 +89,7 @@ class Server:
             
 
     def display_requests(self):
-        c=0
-        for request in self.requests:
-            if request!="":
-                c+=1
-        print(f"Capacity for Server {self.name}: {c}/{self.capacity} ")
+        print(f"Capacity for Server {self.name}: {self.used}/{self.capacity} ")
         
 
 """
@@ -90,6 +100,7 @@ Attributes:
     - ring (list): A list representing the hash ring, with each element containing either an empty string or a Server instance.
     - servers (list): A list containing Server instances.
     - requests (list): A list containing requests to be distributed in the hash ring.
+    - admissionPolicy (KeepRelevantPolicy): Admission rule handed to every server the ring creates.
 
  Methods:
     - add_multiple_Servers(number): Adds multiple servers to the hash ring.
@@ -99,8 +110,9 @@ Attributes:
     """
 
 class ConsistentHashRing:
-    def __init__(self, totalNodes, servers=set(), requests=[]):
+    def __init__(self, totalNodes, servers=set(), requests=[], admissionPolicy=None):
         self.totalNodes=totalNodes
+        self.admissionPolicy=KeepRelevantPolicy(exponent=2, matchPower=1) if admissionPolicy is None else admissionPolicy
         self.ring=[""]*self.totalNodes
         self.servers=servers
         self.requests=requests
@@ -124,7 +136,7 @@ class ConsistentHashRing:
 
     def add_Server(self, Server_name,capacity):
         
-        newServer=Server(Server_name,capacity)
+        newServer=Server(Server_name,capacity,self.admissionPolicy)
         key=mmh3.hash(newServer.name,SEED)%self.totalNodes
         while self.ring[key]!="":
             key+=math.ceil(self.totalNodes/16)
@@ -268,14 +280,7 @@ class ConsistentHashRing:
 # ring.display_ring()
 
 
-all_requests = []
-
-with open(dSet, 'r',errors="ignore") as file:
-    csv_reader = csv.reader(file)
-    for row in csv_reader:
-        if row:
-            if len(all_requests)<DATASIZE:
-                all_requests.append(row[2])
+all_requests = list(readColumn(dSet, 2, DATASIZE))
 
 # print("WITH DS")
 # DsRing=ConsistentHashRing(totalNodes=5000)
@@ -7,7 +7,8 @@ from matplotlib import pyplot as plt
 import mmh3
 import os
 import pandas as pd
-import csv
+from historyCache import makeHistory
+from traceReader import readColumn
 SEED=480
 DATASIZE=10000
 
@@ -26,9 +27,15 @@ Represents a server in the consistent hash ring.
 Attributes:
     - name (str): The name or identifier of the server.
     - requests (list): A list of requests made to the server.
+    - used (int): Number of real (non-empty) requests held, kept up to date on every insert.
+    - dead (bool): Set as soon as the server is full.
 
 Methods:
     - add_request(request): Adds a request to the server.
+    - numRequests(): Returns the number of requests held.
+    - freeSlots(): Returns the remaining capacity.
+    - isFull(): Returns True once the server has reached capacity.
+    - countRequest(request): Updates the counters after a request is stored.
     - display_requests(): Displays the server's requests.
     
 """
@@ -38,21 +45,26 @@ class Server:
         self.requests = [""]
         self.capacity=capacity
         self.requests = [""]*self.capacity
-        
+        self.used=0
         self.dead=False
 
   
     def numRequests(self):
-
-        c=0
-        for request in self.requests:
-            if request!="":
-                c+=1
-        return c
+        return self.used
+    def freeSlots(self):
+        return self.capacity-self.used
+    def isFull(self):
+        return self.used>=self.capacity
+    def countRequest(self, request):
+        if request!="":
+            self.used+=1
+            if self.used>=self.capacity:
+                self.dead=True
     def add_request(self, request):
         if self.numRequests()<self.capacity:
             
             self.requests.append(request)
+            self.countRequest(request)
             return True
         else:
             self.dead=True
@@ -60,11 +72,7 @@ class Server:
             
 
     def display_requests(self):
-        c=0
-        for request in self.requests:
-            if request!="":
-                c+=1
-        print(f"Capacity for Server {self.name}: {c}/{self.capacity} ")
+        print(f"Capacity for Server {self.name}: {self.used}/{self.capacity} ")
         
 
 """
@@ -75,26 +83,32 @@ Attributes:
     - ring (list): A list representing the hash ring, with each element containing either an empty string or a Server instance.
     - servers (list): A list containing Server instances.
     - requests (list): A list containing requests to be distributed in the hash ring.
+    - legacyRehash (bool): Rehash history keys with the old bytes(key) encoding instead of a fixed 8-byte one.
+    - historyCapacity (int): Most recent requests whose key is remembered.
+    - historyPolicy (str): Replacement policy of the history: "lru", "lfu", "arc" or "tinylfu".
+    - history (HistoryCache): Key each recent request was placed with; history.hitRatio() shows how often requests stuck.
 
  Methods:
     - add_multiple_Servers(number): Adds multiple servers to the hash ring.
     - add_Server(Server_name): Adds a server to the hash ring.
     - add_newRequest(request): Adds a request to the hash ring.
+    - rehash(key): Hashes a previously used ring key.
     - display_ring(): Displays the hash ring along with the requests associated with each server.
     """
 
 class ConsistentHashRing:
-    def __init__(self, totalNodes, servers=set(), requests=[]):
+    def __init__(self, totalNodes, servers=set(), requests=[], legacyRehash=False, historyCapacity=100, historyPolicy="lru"):
         self.totalNodes=totalNodes
         self.ring=[""]*self.totalNodes
         self.servers=servers
         self.requests=requests
         self.totalReq=0
         self.totalServer=0
-        self.recentRequests=[]
-        self.requestHistory={}
-        self.historyCapacity=100
+        self.historyCapacity=historyCapacity
+        self.historyPolicy=historyPolicy
+        self.history=makeHistory(historyPolicy,historyCapacity)
         self.extraRun=0
+        self.legacyRehash=legacyRehash
         
         # for server in self.servers:
         #     key=mmh3.hash(server,SEED)%self.totalNodes
@@ -192,14 +206,21 @@ class ConsistentHashRing:
                     
                     not_dead+=1
         return not_dead
+    def rehash(self, key):
+        # bytes(key) builds a zero-filled buffer key bytes long, legacyRehash only exists to reproduce older outputs
+        if self.legacyRehash:
+            return mmh3.hash(bytes(key),SEED)
+        return mmh3.hash(key.to_bytes(8,"little"),SEED)
+
     def add_newRequest(self, request):
         start=time.time()
         
         count=0
         if self.get_alive_servers()>0:
             key=mmh3.hash(request,SEED)%self.totalNodes
-            if request in self.recentRequests:
-                key=mmh3.hash(bytes(self.requestHistory[request]),SEED)%self.totalNodes
+            previous=self.history.get(request)
+            if previous is not None:
+                key=self.rehash(previous)%self.totalNodes
             while self.ring[key]=="" :
             
 
@@ -215,10 +236,7 @@ class ConsistentHashRing:
                     key+=1
                     key=key%self.totalNodes
             end=time.time()
-            if len(self.recentRequests)>=self.historyCapacity:
-                self.recentRequests.pop(0)
-            self.recentRequests.append(request)
-            self.requestHistory[request]=key
+            self.history.put(request,key)
             return end-start
         else:
             return False
@@ -262,14 +280,7 @@ class ConsistentHashRing:
 # ring.display_ring()
 
 
-all_requests = []
-
-with open(dSet, 'r',errors="ignore") as file:
-    csv_reader = csv.reader(file)
-    for row in csv_reader:
-        if row:
-            if len(all_requests)<DATASIZE:
-                all_requests.append(row[2])
+all_requests = list(readColumn(dSet, 2, DATASIZE))
 
 # print("WITH DS")
 # DsRing=ConsistentHashRing(totalNodes=5000)
@@ -0,0 +1,264 @@
+import collections
+import math
+import mmh3
+
+"""
+    Returns the unsigned 64-bit key the sketches count an item under, for callers that have no cached hash of it
+    (a RequestTable's hash64 is used instead wherever there is one).
+    """
+def itemKey(item, seed=0):
+    return mmh3.hash64(str(item),seed,signed=False)[0]
+
+"""
+Represents a Count-Min Sketch: depth rows of width counters. Every request adds one to a counter per row and its
+estimate is the smallest of those counters, so estimates never undercount and memory does not grow with the trace.
+Items are counted by a 64-bit key; row i probes h1+i*h2 (the key's low and high halves), so one hash serves every row.
+
+Attributes:
+    - width, depth (int): Counters per row and number of rows.
+    - table (list): depth rows of width counters, one after the other.
+
+Methods:
+    - positions(key): Returns the counter of every row a key maps to.
+    - add(key, count): Adds count to the key and returns its new estimate.
+    - estimate(key): Returns the (over)estimated count of the key.
+    - decay(factor): Multiplies every counter by factor, so old traffic fades.
+"""
+class CountMinSketch:
+    def __init__(self, width=2048, depth=4):
+        self.width=width
+        self.depth=depth
+        self.table=[0]*(width*depth)
+
+    def positions(self, key):
+        low=key&0xFFFFFFFF
+        # an odd step never shares a factor with a power-of-two width
+        step=(key>>32)|1
+        return [row*self.width+(low+row*step)%self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        table=self.table
+        positions=self.positions(key)
+        for position in positions:
+            table[position]+=count
+        return min([table[position] for position in positions])
+
+    def estimate(self, key):
+        return min([self.table[position] for position in self.positions(key)])
+
+    def decay(self, factor=0.5):
+        self.table=[int(counter*factor) for counter in self.table]
+
+"""
+Represents the Space-Saving top-k summary: at most k monitored items, where a new item replaces the one with the
+smallest count and inherits that count as its possible overestimate.
+
+Attributes:
+    - k (int): Items monitored at once.
+    - counts (dict): Monitored item to its count.
+    - errors (dict): Monitored item to the count it inherited when it entered.
+    - buckets (dict): Count to the monitored items holding it.
+    - low (int): No monitored count is below it.
+
+Methods:
+    - add(item, count): Adds count to the item, replacing the smallest monitored item if needed.
+    - leave(item, count): Takes an item out of the bucket of its old count.
+    - top(n): Returns the n most counted items as (item, count) pairs.
+"""
+class SpaceSaving:
+    def __init__(self, k=64):
+        self.k=k
+        self.counts={}
+        self.errors={}
+        self.buckets={}
+        self.low=0
+
+    def add(self, item, count=1):
+        current=self.counts.get(item)
+        if current is not None:
+            self.leave(item,current)
+        elif len(self.counts)<self.k:
+            current=0
+            self.errors[item]=0
+        else:
+            # counts only grow, so the smallest one is found by walking low up instead of scanning every item
+            while self.low not in self.buckets:
+                self.low+=1
+            smallest=next(iter(self.buckets[self.low]))
+            self.leave(smallest,self.low)
+            del self.counts[smallest]
+            del self.errors[smallest]
+            current=self.low
+            self.errors[item]=current
+        self.counts[item]=current+count
+        self.buckets.setdefault(current+count,set()).add(item)
+
+    def leave(self, item, count):
+        holders=self.buckets[count]
+        holders.discard(item)
+        if not holders:
+            del self.buckets[count]
+
+    def top(self, n=None):
+        ranked=sorted(self.counts.items(),key=lambda pair:pair[1],reverse=True)
+        return ranked if n is None else ranked[:n]
+
+"""
+Represents a linear-counting estimate of how many distinct requests a stream held, in a fixed bitmap.
+
+Attributes:
+    - bits (bytearray): One flag per hash bucket.
+
+Methods:
+    - add(key): Marks the bucket of an item's 64-bit key.
+    - estimate(): Returns the estimated number of distinct items seen.
+"""
+class DistinctCounter:
+    def __init__(self, size=4096):
+        self.bits=bytearray(size)
+
+    def add(self, key):
+        # the high half of the key, the sketch rows already start from the low half
+        self.bits[(key>>32)%len(self.bits)]=1
+
+    def estimate(self):
+        empty=self.bits.count(0)
+        if empty==0:
+            return len(self.bits)
+        return int(round(-len(self.bits)*math.log(float(empty)/len(self.bits))))
+
+"""
+Represents the streaming heavy-hitter state of one server (or of the whole cluster): a Count-Min Sketch for counts,
+Space-Saving for the candidates worth reporting and a distinct counter for the infrequent side.
+
+Attributes:
+    - capacity (int): Capacity the heavy-hitter threshold is a fraction of.
+    - sketch (CountMinSketch), candidates (SpaceSaving), distinct (DistinctCounter): The three summaries.
+    - total (int): Requests recorded.
+    - keyOf (function): Returns the 64-bit key of an item, itemKey unless the items have cached hashes.
+
+Methods:
+    - add(item, count, key): Records count more of the item, whose key is looked up when not given.
+    - top(n): Returns the n candidates with the highest estimates as (item, estimate) pairs.
+    - heavyHitters(threshold): Returns (item, estimate) for the candidates at or above threshold*capacity.
+    - classify(threshold): Returns (heavy, infrequent) distinct request counts, as the end-of-run Counter scan did.
+"""
+class HeavyHitterTracker:
+    def __init__(self, capacity, width=2048, depth=4, k=64, distinctSize=4096, keyOf=None):
+        self.capacity=capacity
+        self.sketch=CountMinSketch(width,depth)
+        self.candidates=SpaceSaving(k)
+        self.distinct=DistinctCounter(distinctSize)
+        self.total=0
+        self.keyOf=itemKey if keyOf is None else keyOf
+
+    def add(self, item, count=1, key=None):
+        if key is None:
+            key=self.keyOf(item)
+        self.sketch.add(key,count)
+        self.candidates.add(item,count)
+        self.distinct.add(key)
+        self.total+=count
+
+    def top(self, n=None):
+        found=sorted([(item,self.sketch.estimate(self.keyOf(item))) for item in self.candidates.counts],key=lambda pair:pair[1],reverse=True)
+        return found if n is None else found[:n]
+
+    def heavyHitters(self, threshold):
+        cutoff=threshold*self.capacity
+        return [pair for pair in self.top() if pair[1]>=cutoff]
+
+    def classify(self, threshold):
+        heavy=len(self.heavyHitters(threshold))
+        return heavy,max(0,self.distinct.estimate()-heavy)
+
+"""
+Represents heavy-hitter tracking for a whole pool: one HeavyHitterTracker per server plus one for the cluster,
+whose threshold is a fraction of the total capacity.
+
+Attributes:
+    - servers (dict): Server name to its tracker.
+    - cluster (HeavyHitterTracker): Tracker over every recorded request.
+    - options (dict): Sketch sizes and keyOf handed to every tracker.
+
+Methods:
+    - record(name, capacity, item, count): Records a request placed on a server.
+    - recordMany(name, capacity, items): Records a batch placed on one server, each distinct item once with its count.
+    - heavyHitters(name, threshold): Returns the heavy hitters of one server, or of the cluster when name is None.
+    - classify(threshold): Returns server name to (heavy, infrequent) counts.
+"""
+class ClusterHeavyHitters:
+    def __init__(self, width=2048, depth=4, k=64, distinctSize=4096, keyOf=None):
+        self.options={"width":width,"depth":depth,"k":k,"distinctSize":distinctSize,"keyOf":itemKey if keyOf is None else keyOf}
+        self.servers={}
+        self.cluster=HeavyHitterTracker(0,**self.options)
+
+    def record(self, name, capacity, item, count=1):
+        tracker=self.servers.get(name)
+        if tracker is None:
+            tracker=HeavyHitterTracker(capacity,**self.options)
+            self.servers[name]=tracker
+            self.cluster.capacity+=capacity
+        # the key is looked up once for both trackers
+        key=self.cluster.keyOf(item)
+        tracker.add(item,count,key)
+        self.cluster.add(item,count,key)
+
+    def recordMany(self, name, capacity, items):
+        for item,count in collections.Counter(items).items():
+            self.record(name,capacity,item,count)
+
+    def heavyHitters(self, name=None, threshold=0.1):
+        tracker=self.cluster if name is None else self.servers.get(name)
+        return [] if tracker is None else tracker.heavyHitters(threshold)
+
+    def classify(self, threshold):
+        return {name:tracker.classify(threshold) for name,tracker in self.servers.items()}
+
+"""
+Represents the live hot-key signal routers replicate on: an aged Count-Min Sketch, halved every window requests,
+and the set of requests currently hot. A request turns hot once its aged count reaches share of its server's
+capacity and only cools again below half of that, so a key near the line does not flap between the two.
+
+Attributes:
+    - share (float): Share of the server's capacity an aged count must reach to turn hot.
+    - window (int): Requests observed between halvings of the sketch.
+    - sketch (CountMinSketch): Aged request counts.
+    - keyOf (function): Returns the 64-bit key of a request, itemKey unless the requests have cached hashes.
+    - hot (set): Requests currently hot.
+    - seen (int): Requests observed.
+    - promotions, demotions (int): Times a request turned hot and cooled down.
+
+Methods:
+    - observe(item, capacity): Counts one more of the item and returns True if it is hot.
+"""
+class HotKeyDetector:
+    def __init__(self, share=0.1, window=10000, width=2048, depth=4, keyOf=None):
+        self.share=share
+        self.window=window
+        self.sketch=CountMinSketch(width,depth)
+        self.keyOf=itemKey if keyOf is None else keyOf
+        self.hot=set()
+        self.seen=0
+        self.promotions=0
+        self.demotions=0
+
+    def __contains__(self, item):
+        return item in self.hot
+
+    def observe(self, item, capacity):
+        count=self.sketch.add(self.keyOf(item))
+        self.seen+=1
+        if self.seen%self.window==0:
+            self.sketch.decay(0.5)
+        if item in self.hot:
+            if count<self.share*capacity/2:
+                self.hot.discard(item)
+                self.demotions+=1
+                return False
+            return True
+        if count>=self.share*capacity:
+            self.hot.add(item)
+            self.promotions+=1
+            return True
+        return False
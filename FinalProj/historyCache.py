@@ -0,0 +1,312 @@
+import collections
+import mmh3
+
+"""
+Represents the shared surface of every history cache: the key each recent request was placed with, bounded to
+capacity entries, with hit, miss and eviction counters so policies can be compared on the same trace.
+
+Attributes:
+    - capacity (int): Most requests remembered at once.
+    - hits, misses, evictions (int): Lookups that found a request, lookups that did not, and requests dropped to stay within capacity.
+
+Methods:
+    - get(request): Returns the remembered key of a request, or None.
+    - put(request, key): Remembers the key of a request, evicting another one when full.
+    - hitRatio(): Returns hits / lookups.
+"""
+class HistoryCache:
+    def __init__(self, capacity=100):
+        self.capacity=max(1,capacity)
+        self.hits=0
+        self.misses=0
+        self.evictions=0
+
+    def lookup(self, key):
+        if key is None:
+            self.misses+=1
+        else:
+            self.hits+=1
+        return key
+
+    def hitRatio(self):
+        lookups=self.hits+self.misses
+        return float(self.hits)/lookups if lookups else 0.0
+
+"""
+Represents a least recently used history.
+
+Attributes:
+    - entries (OrderedDict): Request to its last key, least recently used first.
+"""
+class LRUHistory(HistoryCache):
+    def __init__(self, capacity=100):
+        HistoryCache.__init__(self,capacity)
+        self.entries=collections.OrderedDict()
+
+    def __contains__(self, request):
+        return request in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, request):
+        key=self.entries.get(request)
+        if key is not None:
+            self.entries.move_to_end(request)
+        return self.lookup(key)
+
+    def put(self, request, key):
+        self.entries[request]=key
+        self.entries.move_to_end(request)
+        if len(self.entries)>self.capacity:
+            self.entries.popitem(last=False)
+            self.evictions+=1
+
+"""
+Represents a least frequently used history; ties between equally frequent requests evict the least recently used.
+
+Attributes:
+    - entries (dict): Request to its last key.
+    - frequency (dict): Request to the number of times it was used.
+    - buckets (dict): Use count to the requests with that count, least recently used first.
+    - minFrequency (int): Lowest use count currently held.
+"""
+class LFUHistory(HistoryCache):
+    def __init__(self, capacity=100):
+        HistoryCache.__init__(self,capacity)
+        self.entries={}
+        self.frequency={}
+        self.buckets=collections.defaultdict(collections.OrderedDict)
+        self.minFrequency=0
+
+    def __contains__(self, request):
+        return request in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def touch(self, request):
+        count=self.frequency[request]
+        del self.buckets[count][request]
+        if not self.buckets[count]:
+            del self.buckets[count]
+            if self.minFrequency==count:
+                self.minFrequency=count+1
+        self.frequency[request]=count+1
+        self.buckets[count+1][request]=None
+
+    def get(self, request):
+        key=self.entries.get(request)
+        if key is not None:
+            self.touch(request)
+        return self.lookup(key)
+
+    def put(self, request, key):
+        if request in self.entries:
+            self.entries[request]=key
+            self.touch(request)
+            return
+        if len(self.entries)>=self.capacity:
+            victim,_=self.buckets[self.minFrequency].popitem(last=False)
+            if not self.buckets[self.minFrequency]:
+                del self.buckets[self.minFrequency]
+            del self.entries[victim]
+            del self.frequency[victim]
+            self.evictions+=1
+        self.entries[request]=key
+        self.frequency[request]=1
+        self.buckets[1][request]=None
+        self.minFrequency=1
+
+"""
+Represents an adaptive replacement cache (ARC). Requests seen once live in recent, requests seen again in frequent,
+and the ghost lists remember recently evicted requests so the split between the two adapts to the trace.
+
+Attributes:
+    - recent, frequent (OrderedDict): Cached requests to their keys, least recently used first.
+    - recentGhost, frequentGhost (OrderedDict): Requests recently evicted from recent and frequent, without keys.
+    - target (float): Size recent is steered towards.
+"""
+class ARCHistory(HistoryCache):
+    def __init__(self, capacity=100):
+        HistoryCache.__init__(self,capacity)
+        self.recent=collections.OrderedDict()
+        self.frequent=collections.OrderedDict()
+        self.recentGhost=collections.OrderedDict()
+        self.frequentGhost=collections.OrderedDict()
+        self.target=0
+
+    def __contains__(self, request):
+        return request in self.recent or request in self.frequent
+
+    def __len__(self):
+        return len(self.recent)+len(self.frequent)
+
+    def get(self, request):
+        if request in self.recent:
+            key=self.recent.pop(request)
+            self.frequent[request]=key
+            return self.lookup(key)
+        if request in self.frequent:
+            self.frequent.move_to_end(request)
+            return self.lookup(self.frequent[request])
+        return self.lookup(None)
+
+    def replace(self, request):
+        if self.recent and (len(self.recent)>self.target or (request in self.frequentGhost and len(self.recent)==self.target)):
+            victim,_=self.recent.popitem(last=False)
+            self.recentGhost[victim]=None
+        elif self.frequent:
+            victim,_=self.frequent.popitem(last=False)
+            self.frequentGhost[victim]=None
+        else:
+            return
+        self.evictions+=1
+
+    def put(self, request, key):
+        if request in self.recent:
+            del self.recent[request]
+            self.frequent[request]=key
+            return
+        if request in self.frequent:
+            self.frequent[request]=key
+            self.frequent.move_to_end(request)
+            return
+        if request in self.recentGhost:
+            self.target=min(self.capacity,self.target+max(len(self.frequentGhost)/len(self.recentGhost),1))
+            self.replace(request)
+            del self.recentGhost[request]
+            self.frequent[request]=key
+            return
+        if request in self.frequentGhost:
+            self.target=max(0,self.target-max(len(self.recentGhost)/len(self.frequentGhost),1))
+            self.replace(request)
+            del self.frequentGhost[request]
+            self.frequent[request]=key
+            return
+        if len(self.recent)+len(self.recentGhost)>=self.capacity:
+            if len(self.recent)<self.capacity:
+                self.recentGhost.popitem(last=False)
+                self.replace(request)
+            else:
+                self.recent.popitem(last=False)
+                self.evictions+=1
+        elif len(self)+len(self.recentGhost)+len(self.frequentGhost)>=self.capacity:
+            if len(self)+len(self.recentGhost)+len(self.frequentGhost)>=2*self.capacity:
+                self.frequentGhost.popitem(last=False)
+            self.replace(request)
+        self.recent[request]=key
+
+"""
+Represents an approximate frequency count used by TinyLFUHistory: a count-min sketch of depth rows whose counters
+are all halved once sampleSize increments have been made, so old popularity fades.
+
+Attributes:
+    - width (int): Counters per row.
+    - rows (list): depth lists of counters.
+    - additions, sampleSize (int): Increments since the last halving, and how many trigger one.
+"""
+class FrequencySketch:
+    def __init__(self, width, depth=4, sampleSize=None):
+        self.width=max(16,width)
+        self.rows=[[0]*self.width for x in range(depth)]
+        self.additions=0
+        self.sampleSize=10*self.width if sampleSize is None else sampleSize
+
+    def positions(self, request):
+        text=str(request)
+        return [mmh3.hash(text,seed,signed=False)%self.width for seed in range(len(self.rows))]
+
+    def increment(self, request):
+        for row,position in zip(self.rows,self.positions(request)):
+            row[position]+=1
+        self.additions+=1
+        if self.additions>=self.sampleSize:
+            for row in self.rows:
+                for x in range(self.width):
+                    row[x]//=2
+            self.additions//=2
+
+    def estimate(self, request):
+        return min(row[position] for row,position in zip(self.rows,self.positions(request)))
+
+"""
+Represents a W-TinyLFU history: new requests enter a small LRU window, and a request leaving the window only
+displaces the main cache's next victim if the frequency sketch has seen it more often.
+
+Attributes:
+    - window (OrderedDict): Admission window, about 1% of capacity.
+    - probation, protected (OrderedDict): Segmented LRU main cache; a hit in probation promotes to protected.
+    - windowCapacity, protectedCapacity (int): Sizes of the window and of the protected segment.
+    - sketch (FrequencySketch): Access counts of recent requests, cached or not.
+"""
+class TinyLFUHistory(HistoryCache):
+    def __init__(self, capacity=100):
+        HistoryCache.__init__(self,capacity)
+        self.windowCapacity=max(1,self.capacity//100)
+        self.protectedCapacity=int(0.8*(self.capacity-self.windowCapacity))
+        self.window=collections.OrderedDict()
+        self.probation=collections.OrderedDict()
+        self.protected=collections.OrderedDict()
+        self.sketch=FrequencySketch(4*self.capacity)
+
+    def __contains__(self, request):
+        return request in self.window or request in self.probation or request in self.protected
+
+    def __len__(self):
+        return len(self.window)+len(self.probation)+len(self.protected)
+
+    def promote(self, request, key):
+        self.protected[request]=key
+        if len(self.protected)>self.protectedCapacity:
+            demoted,demotedKey=self.protected.popitem(last=False)
+            self.probation[demoted]=demotedKey
+
+    def get(self, request):
+        self.sketch.increment(request)
+        if request in self.window:
+            self.window.move_to_end(request)
+            return self.lookup(self.window[request])
+        if request in self.protected:
+            self.protected.move_to_end(request)
+            return self.lookup(self.protected[request])
+        if request in self.probation:
+            key=self.probation.pop(request)
+            self.promote(request,key)
+            return self.lookup(key)
+        return self.lookup(None)
+
+    def put(self, request, key):
+        for segment in (self.window,self.probation,self.protected):
+            if request in segment:
+                segment[request]=key
+                segment.move_to_end(request)
+                return
+        self.window[request]=key
+        if len(self.window)<=self.windowCapacity:
+            return
+        candidate,candidateKey=self.window.popitem(last=False)
+        if len(self.probation)+len(self.protected)<self.capacity-self.windowCapacity:
+            self.probation[candidate]=candidateKey
+            return
+        victims=self.probation if self.probation else self.protected
+        if not victims:
+            # a capacity of 1 leaves the main cache no room, so the candidate leaving the window is dropped
+            self.evictions+=1
+            return
+        victim=next(iter(victims))
+        # the main cache is full: keep whichever of the two the sketch has seen more often
+        if self.sketch.estimate(candidate)>self.sketch.estimate(victim):
+            del victims[victim]
+            self.probation[candidate]=candidateKey
+        self.evictions+=1
+
+HISTORY_POLICIES={"lru":LRUHistory,"lfu":LFUHistory,"arc":ARCHistory,"tinylfu":TinyLFUHistory}
+
+"""
+    Builds the history cache named by policy ("lru", "lfu", "arc" or "tinylfu") holding at most capacity requests.
+    """
+def makeHistory(policy="lru", capacity=100):
+    if policy not in HISTORY_POLICIES:
+        raise ValueError(f"unknown history policy {policy!r}, expected one of {sorted(HISTORY_POLICIES)}")
+    return HISTORY_POLICIES[policy](capacity)
@@ -0,0 +1,83 @@
+import mmh3
+import numpy as np
+
+SEED=480
+
+"""
+Represents the distinct requests seen by a pool. Each request string is interned to an integer id the first time it
+is seen, and its 32- and 64-bit murmur hashes are computed once at that point, so repeated requests are never hashed again.
+480Final.py hashes with SEED and spoca.py with its own SEED (500), so a table is only shared by routers with the same seed.
+
+Attributes:
+    - seed (int): Seed both hashes are computed with.
+    - ids (dict): Request string to its id.
+    - names (list): Request string of every id.
+    - hashes32, hashes64 (numpy arrays): mmh3 hash of every id with seed, signed 32-bit and unsigned 64-bit.
+
+Methods:
+    - intern(request): Returns the id of a request (ids are returned unchanged), assigning one the first time it is seen.
+    - internAll(requests): Returns a numpy array with the id of every request.
+    - hash32(request), hash64(request): Return the cached hashes of a request or id.
+    - name(requestId): Returns the request string of an id.
+    - adopt(cache): Takes over the urls and hashes of a TraceCache and returns the request id of every trace row.
+"""
+class RequestTable:
+    def __init__(self, seed=SEED):
+        self.seed=seed
+        self.ids={}
+        self.names=[]
+        self.hashes32=np.zeros(1024,dtype=np.int64)
+        self.hashes64=np.zeros(1024,dtype=np.uint64)
+
+    def __len__(self):
+        return len(self.names)
+
+    def intern(self, request):
+        if isinstance(request,(int,np.integer)):
+            return int(request)
+        requestId=self.ids.get(request)
+        if requestId is None:
+            requestId=len(self.names)
+            if requestId==len(self.hashes32):
+                self.hashes32=np.concatenate((self.hashes32,np.zeros(requestId,dtype=np.int64)))
+                self.hashes64=np.concatenate((self.hashes64,np.zeros(requestId,dtype=np.uint64)))
+            self.hashes32[requestId]=mmh3.hash(request,self.seed)
+            self.hashes64[requestId]=mmh3.hash64(request,self.seed,signed=False)[0]
+            self.ids[request]=requestId
+            self.names.append(request)
+        return requestId
+
+    def internAll(self, requests):
+        if isinstance(requests,np.ndarray):
+            # an array of ids is taken as it is, without a call per request
+            if requests.dtype.kind in "iu":
+                return requests.astype(np.int64)
+            requests=requests.tolist()
+        return np.array([self.intern(request) for request in requests],dtype=np.int64)
+
+    def hash32(self, request):
+        # interned first, a new request can grow the arrays
+        requestId=self.intern(request)
+        return self.hashes32.item(requestId)
+
+    def hash64(self, request):
+        requestId=self.intern(request)
+        return self.hashes64.item(requestId)
+
+    def name(self, requestId):
+        return self.names[requestId]
+
+    def adopt(self, cache):
+        if len(self.names)==0 and cache.seed==self.seed:
+            # an empty table takes the cache's ids as they are, so the trace rows are used without a copy
+            self.names=cache.urls()
+            self.ids={request:requestId for requestId,request in enumerate(self.names)}
+            self.hashes32=np.array(cache.hash32)
+            self.hashes64=np.array(cache.hash64)
+            if len(self.hashes32)==0:
+                self.hashes32=np.zeros(1024,dtype=np.int64)
+                self.hashes64=np.zeros(1024,dtype=np.uint64)
+            return cache.urlId
+        # a table with a different seed hashes the urls itself
+        mapping=np.array([self.intern(request) for request in cache.urls()],dtype=np.int64)
+        return mapping[cache.urlId]
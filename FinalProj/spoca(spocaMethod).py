@@ -7,10 +7,13 @@ from matplotlib import pyplot as plt
 import mmh3
 import os
 import pandas as pd
-import csv
 import random
+import bisect
+from historyCache import makeHistory
+from traceReader import readColumn
 SEED=480
 DATASIZE=5000
+REHASH_FALLBACKS=("fail","overflow","scan")
 
 """
 LOADING DATA SETS
@@ -64,38 +67,57 @@ Attributes:
     - ring (list): A list representing the hash ring, with each element containing either an empty string or a Server instance.
     - servers (list): A list containing Server instances.
     - requests (list): A list containing requests to be distributed in the hash ring.
+    - capacityIndex (list): Running sum of server capacities, capacityIndex[i] is the capacity of servers 0..i.
+    - maxRehash (int): Longest rehash chain a single lookup may follow.
+    - rehashFallback (str): What to do when the chain runs out: "fail", "overflow" (park the request in overflowPool) or "scan" (take the next alive server).
+    - lastHops, totalHops (int): Rehashes used by the most recent lookup and by all lookups so far.
+    - legacyRehash (bool): Rehash with the old bytes(key) encoding instead of a fixed 8-byte one.
+    - historyCapacity (int): Most recent requests whose key is remembered.
+    - historyPolicy (str): Replacement policy of the history: "lru", "lfu", "arc" or "tinylfu".
+    - history (HistoryCache): Key each recent request was placed with; history.hitRatio() shows how often requests stuck.
 
  Methods:
     - add_multiple_Servers(number): Adds multiple servers to the hash ring.
     - add_Server(Server_name): Adds a server to the hash ring.
     - add_newRequest(request): Adds a request to the hash ring.
+    - rehash(key): Hashes a previous key to continue the rehash chain.
+    - serverForKey(key): Maps a key in [0, totalCapacity) to the index of the server owning it.
+    - findServerKey(request): Follows the rehash chain for a request, returns None if no server could take it.
+    - fallbackServerKey(request, serverKey): Applies rehashFallback once the chain is exhausted.
     - display_ring(): Displays the hash ring along with the requests associated with each server.
 """
 class ConsistentHashRing:
-    def __init__(self, totalNodes, servers=[], requests=[]):
+    def __init__(self, totalNodes, servers=[], requests=[], maxRehash=1000, rehashFallback="scan", legacyRehash=False, historyCapacity=100, historyPolicy="lru"):
         self.totalNodes=totalNodes
         self.servers=servers
         self.requests=requests
         self.totalReq=0
         self.totalServer=0
         self.totalCapacity=0
-        self.recentRequests=[]
-        self.requestHistory={}
-        self.historyCapacity=100
+        self.historyCapacity=historyCapacity
+        self.historyPolicy=historyPolicy
+        self.history=makeHistory(historyPolicy,historyCapacity)
         self.extraRun=0
+        self.capacityIndex=[]
+        self.maxRehash=maxRehash
+        if rehashFallback not in REHASH_FALLBACKS:
+            raise ValueError(f"unknown rehashFallback {rehashFallback!r}, expected one of {list(REHASH_FALLBACKS)}")
+        self.rehashFallback=rehashFallback
+        self.legacyRehash=legacyRehash
+        self.overflowPool=[]
+        self.lastHops=0
+        self.totalHops=0
         
         self.totalServer=len(self.servers)
         for server in self.servers:
             self.totalCapacity+=server.capacity
+            self.capacityIndex.append(self.totalCapacity)
 
         for request in self.requests:
             key=mmh3.hash(request,SEED)%(self.totalCapacity*2)
             while key>=self.totalCapacity:
-                key=mmh3.hash(key,SEED)%(self.totalCapacity*2)
-            serverKey=-1
-            while key>0:
-                serverKey+=1
-                key-=self.servers[serverKey].capacity
+                key=self.rehash(key)%(self.totalCapacity*2)
+            serverKey=self.serverForKey(key)
             self.servers[serverKey].add_request(request)
 
     def add_multiple_Servers(self, number,capacity):
@@ -111,6 +133,7 @@ class ConsistentHashRing:
         self.servers.append(newServer)
         self.totalCapacity+=newServer.capacity
         self.totalServer+=1
+        self.capacityIndex.append(self.totalCapacity)
 
     def delete_Server(self,Server_name):
         key=0
@@ -127,35 +150,62 @@ class ConsistentHashRing:
         start=time.time()
         print("Finding server for "+request)
         serverKey=self.findServerKey(request)
+        if serverKey is None:
+            return False
         print("Placed in server "+self.servers[serverKey].name)
         self.servers[serverKey].add_request(request)
         self.totalReq+=1
         end=time.time()
         return end-start
     
+    def rehash(self, key):
+        # bytes(key) builds a zero-filled buffer key bytes long, legacyRehash only exists to reproduce older outputs
+        if self.legacyRehash:
+            return mmh3.hash(bytes(key),SEED)
+        return mmh3.hash(key.to_bytes(8,"little"),SEED)
+
+    def serverForKey(self, key):
+        # a key of 0 never entered the old countdown loop and so landed on servers[-1]
+        if key==0:
+            return len(self.servers)-1
+        return bisect.bisect_left(self.capacityIndex,key)
+
     def findServerKey(self, request):
         # print("Total capacity: "+str(self.totalCapacity))
+        self.lastHops=0
+        serverKey=0
         key=mmh3.hash(request,SEED)%(self.totalCapacity*2)
-        if request in self.recentRequests:
-            key=mmh3.hash(bytes(self.requestHistory[request]),SEED)%(self.totalCapacity*2)
-        while key>=self.totalCapacity:
-            # print("New key: "+str(key))
-            key=mmh3.hash(bytes(key),SEED)%(self.totalCapacity*2)
-        tempKey=key
-        serverKey=-1
-        while key>0:
-            serverKey+=1
+        previous=self.history.get(request)
+        if previous is not None:
+            key=self.rehash(previous)%(self.totalCapacity*2)
+        while self.lastHops<self.maxRehash:
+            if key>=self.totalCapacity:
+                # print("New key: "+str(key))
+                key=self.rehash(key)%(self.totalCapacity*2)
+                self.lastHops+=1
+                continue
+            serverKey=self.serverForKey(key)
             print("serverKey: "+str(serverKey))
-            key-=self.servers[serverKey].capacity
-        if self.servers[serverKey].alive:
-            if len(self.recentRequests)>=self.historyCapacity:
-                self.recentRequests.pop(0)
-            self.recentRequests.append(request)
-            self.requestHistory[request]=tempKey
-            return serverKey
-        print(self.servers[serverKey])
-        self.extraRun+=1
-        return self.findServerKey(bytes(tempKey))
+            if self.servers[serverKey].alive:
+                self.history.put(request,key)
+                self.totalHops+=self.lastHops
+                return serverKey
+            print(self.servers[serverKey])
+            self.extraRun+=1
+            key=self.rehash(key)%(self.totalCapacity*2)
+            self.lastHops+=1
+        return self.fallbackServerKey(request,serverKey)
+
+    def fallbackServerKey(self, request, serverKey):
+        self.totalHops+=self.lastHops
+        if self.rehashFallback=="scan":
+            for x in range(len(self.servers)):
+                nextKey=(serverKey+x)%len(self.servers)
+                if self.servers[nextKey].alive:
+                    return nextKey
+        elif self.rehashFallback=="overflow":
+            self.overflowPool.append(request)
+        return None
 
     def display_ring(self):
         for server in self.servers:
@@ -235,14 +285,7 @@ class ConsistentHashRing:
 # ring.display_ring()
 
 
-all_requests = []
-
-with open(dSet, 'r',errors="ignore") as file:
-    csv_reader = csv.reader(file)
-    for row in csv_reader:
-        if row:
-            if len(all_requests)<DATASIZE:
-                all_requests.append(row[2])
+all_requests = list(readColumn(dSet, 2, DATASIZE))
 
 # print("WITH DS")
 # DsRing=ConsistentHashRing(totalNodes=5000)
@@ -7,10 +7,14 @@ from matplotlib import pyplot as plt
 import mmh3
 import os
 import pandas as pd
-import csv
 import random
+import bisect
+from heavyHitters import ClusterHeavyHitters, HotKeyDetector
+from traceReader import readColumn
+from requestTable import RequestTable
 SEED=500
 DATASIZE=5000
+REHASH_FALLBACKS=("fail","overflow","scan")
 
 """
 LOADING DATA SETS
@@ -26,10 +30,11 @@ Represents a server in the consistent hash ring.
 
 Attributes:
     - name (str): The name or identifier of the server.
-    - requests (list): A list of requests made to the server.
+    - requests (list): Ids of the requests made to the server, names are in the ring's RequestTable.
 
 Methods:
     - add_request(request): Adds a request to the server.
+    - add_requests(batch): Adds a batch of requests already known to fit.
     - display_requests(): Displays the server's requests.
     
 """
@@ -44,11 +49,19 @@ class Server:
         def add_request(self, request):
                 if len(self.requests) < self.capacity:
                         self.requests.append(request)
+                        if len(self.requests) == self.capacity:
+                                self.alive = False
                 else:
                         print("SERVER FULL")
                         self.severOverload += 1
                         self.alive = False
 
+        def add_requests(self, batch):
+                # the caller has already checked the batch fits
+                self.requests.extend(batch)
+                if len(self.requests) >= self.capacity:
+                        self.alive = False
+
         def numRequests(self):
                 return len(self.requests)
 
@@ -64,16 +77,44 @@ Attributes:
     - ring (list): A list representing the hash ring, with each element containing either an empty string or a Server instance.
     - servers (list): A list containing Server instances.
     - requests (list): A list containing requests to be distributed in the hash ring.
+    - capacityIndex (list): Running sum of server capacities, capacityIndex[i] is the capacity of servers 0..i.
+    - maxRehash (int): Longest rehash chain a single lookup may follow.
+    - rehashFallback (str): What to do when the chain runs out: "fail", "overflow" (park the request in overflowPool) or "scan" (take the next alive server).
+    - lastHops, totalHops (int): Rehashes used by the most recent lookup and by all lookups so far.
+    - legacyRehash (bool): Rehash with the old bytes(key) encoding instead of a fixed 8-byte one.
+    - choices (int): Chains (started with SEED, SEED+1, ...) a request follows before taking the least loaded server they reach.
+    - affinity (OrderedDict): Most recent server index of up to affinitySize requests, so a repeated request returns to the same server.
+    - replicas (int): Alive servers, in rehash chain order, a hot request is spread over; 1 turns replication off.
+    - hotKeys (HotKeyDetector): Decides which requests are hot, a request is hot at hotShare of its server's capacity within about hotWindow requests.
+    - usedCapacity, totalCapacity (int): Running totals over all servers.
+    - deadServers, activeServers, aliveServers (int): Running server health counts.
+    - lastBatchTime (float): Seconds taken by the most recent route_batch call.
+    - heavyHitters (ClusterHeavyHitters): Streaming heavy-hitter counts of every placed request, None to skip them.
+    - requestTable (RequestTable): Interned requests and their hashes with SEED; servers, affinity and overflowPool hold the ids.
 
  Methods:
     - add_multiple_Servers(number): Adds multiple servers to the hash ring.
     - add_Server(Server_name): Adds a server to the hash ring.
     - add_newRequest(request): Adds a request to the hash ring.
+    - routeRequest(request): Places a request and returns the index of the server that took it.
+    - route_batch(requests): Places a whole list or array of requests and returns the server index each one landed on (-1 if none).
+    - rehash(key): Hashes a previous key to continue the rehash chain.
+    - serverForKey(key): Maps a key in [0, totalCapacity) to the index of the server owning it.
+    - followChain(key, hops, misses): Follows the rehash chain from key to the first alive server.
+    - requestKey(request, seed): Returns the hash a request's chain starts from, the cached one for SEED.
+    - findServerKey(request, seed): Follows the rehash chain for a request, returns None if no server could take it.
+    - chooseServerKey(request): Returns the least loaded server over the request's choices, or its remembered server.
+    - remember(request, serverKey): Records a request's server in the affinity map.
+    - replicaServerKeys(request): Returns the first replicas distinct alive servers on the request's rehash chain.
+    - fallbackServerKey(request, serverKey): Applies rehashFallback once the chain is exhausted.
+    - placeRequest(server, request): Adds a request to a server and updates the running totals.
+    - placeRequests(server, batch): Same as placeRequest for a batch that fits.
     - display_ring(): Displays the hash ring along with the requests associated with each server.
 """
 class ConsistentHashRing:
-    def __init__(self, totalNodes, servers=[], requests=[]):
+    def __init__(self, totalNodes, servers=[], requests=[], maxRehash=1000, rehashFallback="scan", legacyRehash=False, choices=1, affinitySize=1024, replicas=1, hotShare=0.1, hotWindow=10000, requestTable=None):
         self.totalNodes=totalNodes
+        self.requestTable=RequestTable(SEED) if requestTable is None else requestTable
         self.servers=servers
         self.requests=requests
         self.totalReq=0
@@ -83,20 +124,39 @@ class ConsistentHashRing:
         self.requestHistory={}
         self.historyCapacity=100
         self.extraRun=0
+        self.capacityIndex=[]
+        self.maxRehash=maxRehash
+        if rehashFallback not in REHASH_FALLBACKS:
+            raise ValueError(f"unknown rehashFallback {rehashFallback!r}, expected one of {list(REHASH_FALLBACKS)}")
+        self.rehashFallback=rehashFallback
+        self.legacyRehash=legacyRehash
+        self.overflowPool=[]
+        self.lastHops=0
+        self.totalHops=0
+        self.usedCapacity=0
+        self.deadServers=0
+        self.activeServers=0
+        self.aliveServers=0
+        self.lastBatchTime=0
+        self.choices=choices
+        self.affinity=collections.OrderedDict()
+        self.affinitySize=affinitySize
+        self.heavyHitters=None
+        self.replicas=replicas
+        self.hotKeys=HotKeyDetector(hotShare,hotWindow,keyOf=self.requestTable.hash64) if replicas>1 else None
         
         self.totalServer=len(self.servers)
         for server in self.servers:
             self.totalCapacity+=server.capacity
+            self.capacityIndex.append(self.totalCapacity)
+            self.trackServer(server,1)
 
         for request in self.requests:
-            key=mmh3.hash(request,SEED)%(self.totalCapacity*2)
+            key=self.requestKey(request)%(self.totalCapacity*2)
             while key>=self.totalCapacity:
-                key=mmh3.hash(key,SEED)%(self.totalCapacity*2)
-            serverKey=-1
-            while key>0:
-                serverKey+=1
-                key-=self.servers[serverKey].capacity
-            self.servers[serverKey].add_request(request)
+                key=self.rehash(key)%(self.totalCapacity*2)
+            serverKey=self.serverForKey(key)
+            self.placeRequest(self.servers[serverKey],self.requestTable.intern(request))
 
     def add_multiple_Servers(self, number,capacity):
         for x in range(number):
@@ -111,6 +171,8 @@ class ConsistentHashRing:
         self.servers.append(newServer)
         self.totalCapacity+=newServer.capacity
         self.totalServer+=1
+        self.capacityIndex.append(self.totalCapacity)
+        self.trackServer(newServer,1)
 
     def delete_Server(self,Server_name):
         key=0
@@ -118,53 +180,243 @@ class ConsistentHashRing:
             key+=1
         freeRequests=[]
         if key < self.totalServer:
+            self.trackServer(self.servers[key],-1)
             self.servers[key].alive = False
+            self.trackServer(self.servers[key],1)
             freeRequests=self.servers[key].requests
         for freeRequest in freeRequests:
             self.add_newRequest(freeRequest)
 
     def add_newRequest(self, request):
         start=time.time()
-        print("Finding server for "+request)
-        serverKey=self.findServerKey(request)
+        request=self.requestTable.intern(request)
+        print("Finding server for "+self.requestTable.name(request))
+        serverKey=self.routeRequest(request)
+        if serverKey is None:
+            return False
         print("Placed in server "+self.servers[serverKey].name)
-        self.servers[serverKey].add_request(request)
-        self.totalReq+=1
         end=time.time()
         return end-start
+
+    def routeRequest(self, request):
+        request=self.requestTable.intern(request)
+        if self.replicas>1 and self.aliveServers>0:
+            serverKeys=self.replicaServerKeys(request)
+            # a hot request is spread over its replicas, once it cools down it goes back to its own server
+            if serverKeys and self.hotKeys.observe(request,self.servers[serverKeys[0]].capacity):
+                serverKey=min(serverKeys,key=lambda key:self.servers[key].numRequests()/self.servers[key].capacity)
+                self.placeRequest(self.servers[serverKey],request)
+                self.totalReq+=1
+                return serverKey
+        if self.choices>1:
+            serverKey=self.chooseServerKey(request)
+        else:
+            serverKey=self.findServerKey(request)
+        if serverKey is None:
+            return None
+        self.placeRequest(self.servers[serverKey],request)
+        self.totalReq+=1
+        if self.choices>1:
+            self.remember(request,serverKey)
+        return serverKey
+
+    def route_batch(self, requests):
+        start=time.time()
+        ids=self.requestTable.internAll(requests)
+        requests=ids.tolist()
+        placed=np.full(len(requests),-1,dtype=np.int64)
+        if len(requests)==0 or self.totalCapacity==0:
+            return placed
+        if self.choices>1 or self.replicas>1:
+            # the least loaded choice and the hot set move with every placement, so requests are admitted one at a time
+            for x in range(len(requests)):
+                serverKey=self.routeRequest(requests[x])
+                if serverKey is not None:
+                    placed[x]=serverKey
+            self.lastBatchTime=time.time()-start
+            return placed
+        keys=self.requestTable.hashes32[ids]%(self.totalCapacity*2)
+        target=np.searchsorted(np.array(self.capacityIndex),keys)
+        target[keys==0]=len(self.servers)-1
+        # out of range keys point at a sentinel slot that is never alive, so they follow their chain below
+        target[keys>=self.totalCapacity]=len(self.servers)
+        hops=np.zeros(len(requests),dtype=np.int64)
+        misses=np.zeros(len(requests),dtype=np.int64)
+        x=0
+        while x<len(requests):
+            if self.aliveServers==0:
+                # nothing can be admitted any more, the fallback policy decides for the rest
+                for i in range(x,len(requests)):
+                    serverKey=self.routeRequest(requests[i])
+                    if serverKey is not None:
+                        placed[i]=serverKey
+                break
+            alive=np.array([server.alive for server in self.servers]+[False])
+            # only requests whose server died since the last pass need to walk further down their chain
+            for i in x+np.flatnonzero(~alive[target[x:]] & (hops[x:]<self.maxRehash)):
+                target[i],keys[i],hops[i],misses[i]=self.followChain(int(keys[i]),hops[i],misses[i])
+                if hops[i]>=self.maxRehash:
+                    target[i]=len(self.servers)
+            free=np.array([server.capacity-server.numRequests() for server in self.servers]+[0])
+            pending=target[x:]
+            order=np.argsort(pending,kind="stable")
+            sortedTarget=pending[order]
+            rank=np.empty(len(pending),dtype=np.int64)
+            rank[order]=np.arange(len(pending))-np.searchsorted(sortedTarget,sortedTarget)
+            blocked=np.flatnonzero(~alive[pending] | (rank>=free[pending]))
+            end=blocked[0] if len(blocked) else len(pending)
+            admitted=order[order<end]
+            if len(admitted):
+                groups=np.split(admitted,np.flatnonzero(np.diff(pending[admitted]))+1)
+                for group in groups:
+                    self.placeRequests(self.servers[pending[group[0]]],[requests[x+i] for i in group])
+                    placed[x+group]=pending[group[0]]
+                self.extraRun+=int(misses[x:x+end].sum())
+                self.totalHops+=int(hops[x:x+end].sum())
+                self.lastHops=int(hops[x+end-1])
+                self.totalReq+=end
+            x+=end
+            # a server filled up under the next request or its chain ran out, so it takes the one-at-a-time path;
+            # once passes stop admitting much (a saturated cluster) a longer stretch goes that way too
+            for i in range(x,min(x+(1 if end>=64 else 64),len(requests))):
+                serverKey=self.routeRequest(requests[i])
+                if serverKey is not None:
+                    placed[i]=serverKey
+                x+=1
+        self.lastBatchTime=time.time()-start
+        return placed
     
-    def findServerKey(self, request):
+    def rehash(self, key):
+        # bytes(key) builds a zero-filled buffer key bytes long, legacyRehash only exists to reproduce older outputs
+        if self.legacyRehash:
+            return mmh3.hash(bytes(key),SEED)
+        return mmh3.hash(key.to_bytes(8,"little"),SEED)
+
+    def serverForKey(self, key):
+        # a key of 0 never entered the old countdown loop and so landed on servers[-1]
+        if key==0:
+            return len(self.servers)-1
+        return bisect.bisect_left(self.capacityIndex,key)
+
+    def followChain(self, key, hops=0, misses=0):
+        # returns (serverKey, key, hops, misses); hops reaching maxRehash means the chain ran out
+        serverKey=0
+        while hops<self.maxRehash:
+            if key>=self.totalCapacity:
+                key=self.rehash(key)%(self.totalCapacity*2)
+                hops+=1
+                continue
+            serverKey=self.serverForKey(key)
+            if self.servers[serverKey].alive:
+                return serverKey,key,hops,misses
+            misses+=1
+            key=self.rehash(key)%(self.totalCapacity*2)
+            hops+=1
+        return serverKey,key,hops,misses
+
+    def requestKey(self, request, seed=SEED):
+        if seed==self.requestTable.seed:
+            return self.requestTable.hash32(request)
+        # only the extra choices start from another seed, they hash the name
+        return mmh3.hash(self.requestTable.name(self.requestTable.intern(request)),seed)
+
+    def findServerKey(self, request, seed=SEED):
         # print("Total capacity: "+str(self.totalCapacity))
-        key=mmh3.hash(request,SEED)%(self.totalCapacity*2)
-        while key>=self.totalCapacity:
-            print("New key: "+str(key))
-            print("Capacity: "+str(self.totalCapacity))
-            key=mmh3.hash(bytes(key),SEED)%(self.totalCapacity*2)
-        serverKey=-1
-        tempKey=key
-        while key>0:
-            serverKey+=1
-            print("serverKey: "+str(serverKey))
-            key-=self.servers[serverKey].capacity
-        if self.servers[serverKey].alive:
+        self.lastHops=0
+        if self.aliveServers==0:
+            return self.fallbackServerKey(request,0)
+        key=self.requestKey(request,seed)%(self.totalCapacity*2)
+        serverKey,key,self.lastHops,misses=self.followChain(key)
+        self.extraRun+=misses
+        if self.lastHops>=self.maxRehash:
+            return self.fallbackServerKey(request,serverKey)
+        self.totalHops+=self.lastHops
+        return serverKey
+
+    def chooseServerKey(self, request):
+        serverKey=self.affinity.get(request)
+        if serverKey is not None and serverKey<len(self.servers) and self.servers[serverKey].alive:
             return serverKey
-        print(self.servers[serverKey])
-        self.extraRun+=1
-        return self.findServerKey(bytes(tempKey))
+        best=None
+        if self.aliveServers>0:
+            for i in range(self.choices):
+                serverKey,key,hops,misses=self.followChain(self.requestKey(request,SEED+i)%(self.totalCapacity*2))
+                self.extraRun+=misses
+                self.totalHops+=hops
+                if hops>=self.maxRehash:
+                    continue
+                server=self.servers[serverKey]
+                load=server.numRequests()/server.capacity
+                if best is None or load<bestLoad:
+                    best=serverKey
+                    bestLoad=load
+        if best is None:
+            # no chain reached an alive server, the single chain and its fallback decide
+            return self.findServerKey(request)
+        return best
+
+    def remember(self, request, serverKey):
+        self.affinity[request]=serverKey
+        self.affinity.move_to_end(request)
+        if len(self.affinity)>self.affinitySize:
+            self.affinity.popitem(last=False)
+
+    def replicaServerKeys(self, request):
+        # the replicas are the servers the chain reaches after the request's own, as SPOCA does for popular content
+        serverKeys=[]
+        key=self.requestKey(request)%(self.totalCapacity*2)
+        hops=0
+        while len(serverKeys)<self.replicas and hops<self.maxRehash:
+            serverKey,key,hops,misses=self.followChain(key,hops)
+            if hops>=self.maxRehash:
+                break
+            if serverKey not in serverKeys:
+                serverKeys.append(serverKey)
+            key=self.rehash(key)%(self.totalCapacity*2)
+            hops+=1
+        return serverKeys
+
+    def fallbackServerKey(self, request, serverKey):
+        self.totalHops+=self.lastHops
+        if self.rehashFallback=="scan":
+            for x in range(len(self.servers)):
+                nextKey=(serverKey+x)%len(self.servers)
+                if self.servers[nextKey].alive:
+                    return nextKey
+        elif self.rehashFallback=="overflow":
+            self.overflowPool.append(request)
+        return None
 
     def display_ring(self):
         for server in self.servers:
             server.display_requests()
 
-    def calculate_load_distribution(self):
-        used_capacity=0
-        total_capacity=0
+    def trackServer(self, server, sign):
+        # adds (sign=1) or withdraws (sign=-1) a server's share of the running totals
+        self.usedCapacity+=sign*server.numRequests()
+        if server.numRequests()==server.capacity:
+            self.deadServers+=sign
+        if server.alive:
+            self.aliveServers+=sign
+            if server.numRequests()>0:
+                self.activeServers+=sign
+
+    def placeRequest(self, server, request):
+        self.trackServer(server,-1)
+        server.add_request(request)
+        self.trackServer(server,1)
+        if self.heavyHitters is not None:
+            self.heavyHitters.record(server.name,server.capacity,request)
+
+    def placeRequests(self, server, batch):
+        self.trackServer(server,-1)
+        server.add_requests(batch)
+        self.trackServer(server,1)
+        if self.heavyHitters is not None:
+            self.heavyHitters.recordMany(server.name,server.capacity,batch)
 
-        for server in self.servers:
-            used_capacity+=server.numRequests()
-            total_capacity+=server.capacity
-        
-        return used_capacity/total_capacity
+    def calculate_load_distribution(self):
+        return float(self.usedCapacity)/self.totalCapacity
 
     def get_total_requests(self):
         return self.totalReq
@@ -173,35 +425,13 @@ class ConsistentHashRing:
         return self.totalServer
     
     def get_dead_servers(self):
-        dead=0
-        for server in self.servers:
-                if len(server.requests)==server.capacity:
-                        server.alive=False
-                        dead+=1
-        return dead
-    
-    def calculate_load_distribution(self):
-        used_capacity=0
-        total_capacity=0
-        
-        for server in self.servers:
-            used_capacity+=server.numRequests()
-            total_capacity+=server.capacity
-        return float(used_capacity)/total_capacity
+        return self.deadServers
     
     def get_active_servers(self):
-        not_dead=0
-        for server in self.servers:
-            if server.alive and server.numRequests()>0:
-                not_dead+=1
-        return not_dead
+        return self.activeServers
     
     def get_alive_servers(self):
-        not_dead=0
-        for server in self.servers:
-            if server.alive:
-                not_dead+=1
-        return not_dead
+        return self.aliveServers
 
 # """
 # TESTING RING WITH RANDOM 5 SERVERS
@@ -230,15 +460,6 @@ class ConsistentHashRing:
 # ring.display_ring()
 
 
-all_requests = []
-
-with open(dSet, 'r',errors="ignore") as file:
-    csv_reader = csv.reader(file)
-    for row in csv_reader:
-        if row:
-            if len(all_requests)<DATASIZE:
-                all_requests.append(row[2])
-
 # print("WITH DS")
 # DsRing=ConsistentHashRing(totalNodes=5000)
 
@@ -250,11 +471,14 @@ with open(dSet, 'r',errors="ignore") as file:
 
 # print(f"Load Distribution: {load_distribution}")
 
-print("expirement")
+requestTable=RequestTable(SEED)
 
-def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_requests, threshold):
+def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_requests, threshold, liveHeavyHitters=False):
     # Initialize ConsistentHashRing
-    ring = ConsistentHashRing(total_nodes)
+    ring = ConsistentHashRing(total_nodes, requestTable=requestTable)
+    # the sketches only ride along every placement when asked to, otherwise the held requests are summarised once at the end
+    if liveHeavyHitters:
+        ring.heavyHitters=ClusterHeavyHitters(keyOf=ring.requestTable.hash64)
 
     # Lists to store data for visualizations
     
@@ -289,16 +513,22 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
         active_servers_data.append(ring.get_active_servers())
         alive_servers_data.append(ring.get_alive_servers())
         health_status_data.append([server.numRequests() for server in ring.servers if isinstance(server, Server)])
-        server_index = mmh3.hash(all_requests[i], SEED) % total_nodes
+        server_index = ring.requestTable.hash32(all_requests[i]) % total_nodes
         latency.append((i,server_index,time_taken[i]))
     
     
 
+    if ring.heavyHitters is None:
+        ring.heavyHitters=ClusterHeavyHitters(keyOf=ring.requestTable.hash64)
+        for server in ring.servers:
+            if isinstance(server, Server):
+                ring.heavyHitters.recordMany(server.name,server.capacity,server.requests)
+    # classified from the streaming sketches, so the same counts are available at any point of the replay
+    classes=ring.heavyHitters.classify(threshold)
     heavy_hitters_map={}
     infrequent_hitter_map={}
     for server in ring.servers:
-        heavy_hitters_map[server.name]=0
-        infrequent_hitter_map[server.name]=0
+        heavy_hitters_map[server.name],infrequent_hitter_map[server.name]=classes.get(server.name,(0,0))
 
 
     for server in ring.servers:
@@ -307,22 +537,11 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
         if isinstance(server, Server):
     
             
-            countReq=collections.Counter(server.requests)
-            for key,val in countReq.items():
-                if val>=threshold*server.capacity:
-                    
-                    heavy_hitters_map[server.name]+=1
-                 
-                else:
-                    
-                    infrequent_hitter_map[server.name]+=1
-                  
-                
-            
-            
+            # the most requested ids Space-Saving kept for this server, names are only looked up for the plot labels
+            topReq=ring.heavyHitters.servers[server.name].top() if server.name in ring.heavyHitters.servers else []
             
             plt.figure(figsize=(8, 5))
-            plt.bar(countReq.keys(), countReq.values())
+            plt.bar([ring.requestTable.name(key) for key,val in topReq], [val for key,val in topReq])
             plt.axhline(y=threshold*server.capacity, color='red', linestyle='--', label=f'Threshold ({threshold*server.capacity})')
             plt.title(f"Heavy Hitters for Server {server.name} total servers: {num_servers}, threshold{threshold}")
             plt.xlabel("Requests")                
@@ -415,10 +634,15 @@ def visualization_from_dataset(total_nodes, num_servers, server_capacity, all_re
     # plt.show()
 
 #visualization_from_dataset(total_nodes=5000, num_servers=9, server_capacity=[50,500], all_requests=all_requests, threshold=0.15)
-serverNum=[10]
-threshold=[0.1,0.25,0.5]
-server_cap=[[100,1000],[500,5000]]
-for x in serverNum:
-    for y in threshold:
-        for z in server_cap:
-            visualization_from_dataset(total_nodes=1000, num_servers=x, server_capacity=z, all_requests=all_requests, threshold=y)
+# the experiments only run as a script, so 480Final.py can import the ring for benchmark_engines
+if __name__=="__main__":
+    # every url is interned once, the ring then routes the ids with their cached hashes
+    all_requests = np.fromiter(map(requestTable.intern,readColumn(dSet, 2, DATASIZE)),dtype=np.int64)
+    print("expirement")
+    serverNum=[10]
+    threshold=[0.1,0.25,0.5]
+    server_cap=[[100,1000],[500,5000]]
+    for x in serverNum:
+        for y in threshold:
+            for z in server_cap:
+                visualization_from_dataset(total_nodes=1000, num_servers=x, server_capacity=z, all_requests=all_requests, threshold=y)
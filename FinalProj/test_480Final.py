@@ -0,0 +1,137 @@
+import importlib.util
+import math
+import os
+import random
+import numpy as np
+import pytest
+
+# 480Final.py plots with these, so the engines can only be imported where they are installed
+for module in ["seaborn","matplotlib","pandas"]:
+    pytest.importorskip(module)
+
+"""
+    Imports 480Final.py, whose name is not a valid module name, without running its experiments.
+    """
+def loadEngines():
+    spec=importlib.util.spec_from_file_location("final480",os.path.join(os.path.dirname(__file__),"480Final.py"))
+    module=importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+final=loadEngines()
+ENGINES=[final.ConsistentHashRing,final.JumpHashRing,final.RendezvousRing,final.SkeletonRendezvousRing,final.MaglevRing]
+
+"""
+    Returns an engine with one server per capacity, named Server0, Server1, ...
+    """
+def buildPool(engine, capacities, **options):
+    pool=engine(1000,**options)
+    for i,capacity in enumerate(capacities):
+        pool.add_Server(f"Server{i}",capacity)
+    return pool
+
+"""
+    Returns count requests drawn from keys distinct urls, the same ones for the same seed.
+    """
+def requestStream(count, keys=300, seed=480):
+    rng=random.Random(seed)
+    return [f"u{rng.randrange(keys)}" for x in range(count)]
+
+"""
+    Routes requests one at a time and returns the serverList position each one landed on (-1 if none).
+    """
+def routeSequential(pool, requests):
+    placed=[]
+    for request in requests:
+        slot=pool.routeRequest(request)
+        placed.append(-1 if slot is None else slot)
+    if isinstance(pool,final.ConsistentHashRing):
+        return pool.serverPositions(np.array(placed,dtype=np.int64)).tolist()
+    return placed
+
+@pytest.mark.parametrize("engine",ENGINES)
+def test_batchMatchesSequential(engine):
+    capacities=[20,60,20,60,5]
+    requests=requestStream(400)
+    sequential=buildPool(engine,capacities)
+    batch=buildPool(engine,capacities)
+    assert batch.route_batch(requests).tolist()==routeSequential(sequential,requests)
+    assert batch.occupancyVector().tolist()==sequential.occupancyVector().tolist()
+    assert (batch.usedCapacity,batch.deadServers,batch.activeServers,batch.aliveServers)==(sequential.usedCapacity,sequential.deadServers,sequential.activeServers,sequential.aliveServers)
+
+def test_ringBatchReportsServersWithVnodes():
+    pool=buildPool(final.ConsistentHashRing,[50,50,50],vnodes=8)
+    placed=pool.route_batch(requestStream(120))
+    assert placed.min()>=0 and placed.max()<len(pool.serverList())
+    assert np.bincount(placed,minlength=3).tolist()==pool.occupancyVector().tolist()
+
+@pytest.mark.parametrize("engine",ENGINES)
+def test_timestampedBatchMatchesSequential(engine):
+    rng=random.Random(21)
+    for trial in range(20):
+        capacities=[rng.choice([2,4,8]) for x in range(rng.randint(1,5))]
+        requests=requestStream(300,keys=60,seed=trial)
+        moments=[]
+        now=1000
+        for request in requests:
+            now+=rng.choice([0,0,0.5,1,1,3])
+            moments.append(now)
+        sequential=buildPool(engine,capacities)
+        batch=buildPool(engine,capacities)
+        for pool in [sequential,batch]:
+            pool.setExpiry(ttl=8,halfLife=5,wheelSlots=4)
+        expected=[]
+        for request,moment in zip(requests,moments):
+            sequential.advanceClock(moment)
+            expected.append(routeSequential(sequential,[request])[0])
+        placed=[]
+        for begin in range(0,len(requests),50):
+            # odd trials push every run through the batch path, however short
+            placed+=batch.routeRuns(requests[begin:begin+50],moments[begin:begin+50],minRun=1 if trial%2 else 16).tolist()
+        assert placed==expected
+        assert batch.occupancyVector().tolist()==sequential.occupancyVector().tolist()
+        assert np.allclose(batch.decayedLoads(),sequential.decayedLoads())
+
+def test_requestExpiresOneTtlAfterItWasMade():
+    pool=buildPool(final.JumpHashRing,[4,4,2])
+    pool.setExpiry(ttl=8,wheelSlots=4)
+    pool.route_batch(["a","b"],timestamps=[12,13])
+    pool.advanceClock(20.5)
+    assert pool.occupancyVector().sum()==1
+    pool.advanceClock(22)
+    assert pool.occupancyVector().sum()==0
+
+def test_boundedLoadKeepsEveryServerUnderItsCap():
+    capacities=[1000,1000,2000,1000]
+    # a handful of urls, so a few servers own the whole stream without the cap
+    requests=requestStream(800,keys=6)
+    unbounded=buildPool(final.ConsistentHashRing,capacities)
+    bounded=buildPool(final.ConsistentHashRing,capacities,loadFactor=0.25)
+    total=sum(capacities)
+    for request in requests:
+        unbounded.routeRequest(request)
+        bounded.routeRequest(request)
+        for server,capacity in zip(bounded.serverList(),capacities):
+            assert server.numRequests()<=math.ceil(1.25*bounded.usedCapacity*capacity/total)
+    assert bounded.usedCapacity==len(requests)
+    assert bounded.occupancyVector().max()<unbounded.occupancyVector().max()
+
+def test_maglevTableIsBalanced():
+    pool=buildPool(final.MaglevRing,[10]*7,tableSize=1009)
+    shares=np.bincount(pool.table,minlength=7)
+    assert shares.sum()==1009
+    # every member claims entries in turn, so the shares differ by at most one round
+    assert shares.max()-shares.min()<=1
+
+def test_maglevJoinMovesLittleOfTheTable():
+    pool=buildPool(final.MaglevRing,[10]*10,tableSize=10007)
+    before=pool.table.copy()
+    pool.add_Server("Server10",10)
+    moved=np.mean(before!=pool.table)
+    assert moved==pool.lastDisruption
+    # the ideal is the new member's share, 1/11 of the entries
+    assert 1/11<=moved<1.5/11
+
+def test_maglevRejectsCompositeTableSize():
+    with pytest.raises(ValueError):
+        final.MaglevRing(tableSize=65536)
@@ -0,0 +1,80 @@
+import collections
+import math
+import random
+from heavyHitters import CountMinSketch, SpaceSaving, DistinctCounter, HeavyHitterTracker, ClusterHeavyHitters, HotKeyDetector, itemKey
+
+"""
+    Returns a skewed stream of count items, item i drawn in proportion to 1/(i+1).
+    """
+def skewedStream(count, keys=5000, seed=19):
+    rng=random.Random(seed)
+    weights=[1.0/(rank+1) for rank in range(keys)]
+    return rng.choices(range(keys),weights=weights,k=count)
+
+def test_countMinStaysWithinItsErrorBound():
+    stream=skewedStream(50000)
+    truth=collections.Counter(stream)
+    sketch=CountMinSketch(width=512,depth=4)
+    for item in stream:
+        sketch.add(itemKey(item))
+    # an estimate exceeds the true count by more than e/width of the stream with probability at most e^-depth
+    bound=math.e/512*len(stream)
+    over=[sketch.estimate(itemKey(item))-count for item,count in truth.items()]
+    assert min(over)>=0
+    assert sum(1 for error in over if error>bound)<=len(over)*math.exp(-4)
+
+def test_countMinDecayHalvesCounts():
+    sketch=CountMinSketch(width=64,depth=2)
+    assert sketch.add(itemKey("a"),10)==10
+    sketch.decay(0.5)
+    assert sketch.estimate(itemKey("a"))==5
+
+def test_spaceSavingKeepsEveryFrequentItem():
+    stream=skewedStream(50000)
+    truth=collections.Counter(stream)
+    summary=SpaceSaving(k=64)
+    for item in stream:
+        summary.add(item)
+    assert len(summary.counts)==64
+    # every item above n/k is monitored, and a count is off by at most what it inherited
+    for item,count in truth.items():
+        if count>len(stream)/64:
+            assert item in summary.counts
+    for item,count in summary.counts.items():
+        assert truth[item]<=count<=truth[item]+summary.errors[item]
+
+def test_distinctCounterEstimate():
+    counter=DistinctCounter(4096)
+    for item in range(1000):
+        counter.add(itemKey(item))
+        counter.add(itemKey(item))
+    assert abs(counter.estimate()-1000)<=50
+
+def test_trackerClassifiesHeavyHitters():
+    tracker=HeavyHitterTracker(capacity=100)
+    for x in range(30):
+        tracker.add("hot")
+    for item in range(20):
+        tracker.add(f"cold{item}")
+    assert tracker.heavyHitters(0.25)==[("hot",30)]
+    assert tracker.classify(0.25)==(1,20)
+
+def test_clusterRecordManyMatchesRecord():
+    # fewer distinct items than Space-Saving monitors, so the order they are counted in can not matter
+    items=skewedStream(2000,keys=50)
+    one=ClusterHeavyHitters()
+    many=ClusterHeavyHitters()
+    for item in items:
+        one.record("Server0",500,item)
+    many.recordMany("Server0",500,items)
+    assert one.classify(0.01)==many.classify(0.01)
+    assert dict(one.cluster.top(5))==dict(many.cluster.top(5))
+
+def test_hotKeyTurnsHotAndCools():
+    detector=HotKeyDetector(share=0.1,window=100)
+    assert not any(detector.observe("hot",100) for x in range(9))
+    assert detector.observe("hot",100)
+    for item in range(400):
+        detector.observe(f"cold{item}",100)
+    assert not detector.observe("hot",100)
+    assert (detector.promotions,detector.demotions)==(1,1)
@@ -0,0 +1,68 @@
+import random
+import pytest
+from historyCache import HISTORY_POLICIES, makeHistory
+
+"""
+    Looks every request up and remembers it on a miss, the way the SPOCA ring uses its history.
+    """
+def replay(history, requests):
+    for request in requests:
+        if history.get(request) is None:
+            history.put(request,f"key-{request}")
+
+@pytest.mark.parametrize("policy",sorted(HISTORY_POLICIES))
+@pytest.mark.parametrize("capacity",[1,2,10,50])
+def test_historyStaysWithinCapacity(policy, capacity):
+    rng=random.Random(capacity)
+    history=makeHistory(policy,capacity)
+    inserted=0
+    for x in range(3000):
+        request=int(rng.paretovariate(1.2))%200
+        if history.get(request) is None:
+            history.put(request,f"key-{request}")
+            inserted+=1
+        assert len(history)<=capacity
+    assert history.hits+history.misses==3000
+    # every request put and no longer held was counted as an eviction
+    assert history.evictions==inserted-len(history)
+
+@pytest.mark.parametrize("policy",sorted(HISTORY_POLICIES))
+def test_historyRemembersTheLatestKey(policy):
+    history=makeHistory(policy,10)
+    history.put("a","Server1")
+    history.put("a","Server2")
+    assert history.get("a")=="Server2"
+    assert len(history)==1
+
+def test_lruEvictsLeastRecentlyUsed():
+    history=makeHistory("lru",3)
+    replay(history,["a","b","c","a","d"])
+    assert "b" not in history
+    assert all(request in history for request in ["a","c","d"])
+
+def test_lfuEvictsLeastFrequentlyUsedThenOldest():
+    history=makeHistory("lfu",3)
+    replay(history,["a","a","b","b","c","d"])
+    # c and d were used once, c longer ago
+    assert "c" not in history
+    replay(history,["e"])
+    assert "d" not in history
+    assert all(request in history for request in ["a","b","e"])
+
+@pytest.mark.parametrize("policy",["arc","tinylfu"])
+def test_frequentRequestsSurviveAScan(policy):
+    history=makeHistory(policy,100)
+    hot=[f"hot{x}" for x in range(20)]
+    for x in range(5):
+        replay(history,hot)
+    replay(history,[f"scan{x}" for x in range(300)])
+    assert all(request in history for request in hot)
+    lru=makeHistory("lru",100)
+    for x in range(5):
+        replay(lru,hot)
+    replay(lru,[f"scan{x}" for x in range(300)])
+    assert not any(request in lru for request in hot)
+
+def test_unknownPolicyIsRejected():
+    with pytest.raises(ValueError):
+        makeHistory("fifo")
@@ -0,0 +1,19 @@
+import mmh3
+import numpy as np
+from requestTable import RequestTable
+
+def test_internHashesOnceWithTheTableSeed():
+    table=RequestTable(500)
+    first=table.intern("a")
+    assert table.intern("a")==first and table.intern(first)==first
+    assert table.hash32("a")==mmh3.hash("a",500)
+    assert table.hash64(first)==mmh3.hash64("a",500,signed=False)[0]
+    assert table.name(first)=="a"
+
+def test_internAllTakesIdsAndGrows():
+    table=RequestTable()
+    ids=table.internAll([f"u{x}" for x in range(3000)])
+    assert ids.tolist()==list(range(3000))
+    assert table.internAll(ids[::-1]).tolist()==ids[::-1].tolist()
+    assert table.hash32(2999)==mmh3.hash("u2999",table.seed)
+    assert len(table)==3000
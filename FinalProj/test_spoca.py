@@ -0,0 +1,16 @@
+import pytest
+
+# spoca.py plots with these, so the ring can only be imported where they are installed
+for module in ["seaborn","matplotlib","pandas"]:
+    pytest.importorskip(module)
+
+import spoca
+
+def test_unknownRehashFallbackIsRejected():
+    with pytest.raises(ValueError):
+        spoca.ConsistentHashRing(100,servers=[],rehashFallback="skip")
+
+@pytest.mark.parametrize("fallback",spoca.REHASH_FALLBACKS)
+def test_knownRehashFallbacksAreAccepted(fallback):
+    ring=spoca.ConsistentHashRing(100,servers=[],rehashFallback=fallback)
+    assert ring.rehashFallback==fallback
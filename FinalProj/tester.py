@@ -7,7 +7,7 @@ from matplotlib import pyplot as plt
 import mmh3
 import os
 import pandas as pd
-import csv
+from traceReader import readColumn
 
 """
 LOADING DATA SETS
@@ -21,14 +21,7 @@ dSet=os.path.join(currDir,"Datasets","dataset.csv")
 SEED=480
 DATASIZE=1000
 
-all_requests = []
-
-with open(dSet, 'r',errors="ignore") as file:
-    csv_reader = csv.reader(file)
-    for row in csv_reader:
-        if row:
-            if len(all_requests)<DATASIZE:
-                all_requests.append(row[2])
+all_requests = list(readColumn(dSet, 2, DATASIZE))
 
 # print("WITH DS")
 # DsRing=ConsistentHashRing(totalNodes=5000)
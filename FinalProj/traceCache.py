@@ -0,0 +1,96 @@
+import os
+import mmh3
+import numpy as np
+from traceReader import readTrace
+
+SEED=480
+
+COLUMNS=["urlId","firstTs","lastTs","visitCount","duration","hash32","hash64","urlBytes","urlOffsets"]
+
+"""
+    Returns the directory the binary cache of a trace is kept in, next to the csv unless cacheDir is given.
+    """
+def cachePath(csvPath, cacheDir=None):
+    stem=os.path.splitext(os.path.basename(csvPath))[0]
+    return os.path.join(cacheDir if cacheDir else os.path.dirname(csvPath),stem+".npycache")
+
+"""
+    Converts a DS1 trace csv into one .npy file per column: urlId (row to distinct url), the row timestamps and
+    counts, and per distinct url its mmh3 hashes with SEED plus its utf-8 bytes and their offsets. Returns the directory.
+    """
+def buildCache(csvPath, cacheDir=None):
+    path=cachePath(csvPath,cacheDir)
+    os.makedirs(path,exist_ok=True)
+    ids={}
+    urls=[]
+    rows={"urlId":[],"firstTs":[],"lastTs":[],"visitCount":[],"duration":[]}
+    for record in readTrace(csvPath):
+        urlId=ids.get(record.url)
+        if urlId is None:
+            urlId=len(urls)
+            ids[record.url]=urlId
+            urls.append(record.url)
+        rows["urlId"].append(urlId)
+        rows["firstTs"].append(record.firstTs)
+        rows["lastTs"].append(record.lastTs)
+        rows["visitCount"].append(record.visitCount)
+        rows["duration"].append(record.duration)
+    columns={"urlId":np.array(rows["urlId"],dtype=np.int64)}
+    for name in ["firstTs","lastTs","visitCount","duration"]:
+        columns[name]=np.array(rows[name],dtype=np.int64)
+    columns["hash32"]=np.array([mmh3.hash(url,SEED) for url in urls],dtype=np.int64)
+    columns["hash64"]=np.array([mmh3.hash64(url,SEED,signed=False)[0] for url in urls],dtype=np.uint64)
+    encoded=[url.encode("utf-8") for url in urls]
+    columns["urlBytes"]=np.frombuffer(b"".join(encoded),dtype=np.uint8)
+    columns["urlOffsets"]=np.cumsum([0]+[len(url) for url in encoded],dtype=np.int64)
+    for name in COLUMNS:
+        # written under a temporary name first, so a reader never maps a half written column
+        np.save(os.path.join(path,name+".tmp.npy"),columns[name])
+        os.replace(os.path.join(path,name+".tmp.npy"),os.path.join(path,name+".npy"))
+    return path
+
+"""
+Represents a DS1 trace loaded from its binary cache. Every column is memory-mapped read-only, so loading costs no
+parsing or hashing and processes replaying the same trace share its pages.
+
+Attributes:
+    - path (str): Directory of the .npy columns.
+    - seed (int): Seed the hash columns were computed with, SEED.
+    - urlId, firstTs, lastTs, visitCount, duration (numpy arrays): One entry per trace row.
+    - hash32, hash64 (numpy arrays): mmh3 hashes of every distinct url with SEED, as RequestTable caches them.
+    - urlBytes, urlOffsets (numpy arrays): The distinct urls, url i being urlBytes[urlOffsets[i]:urlOffsets[i+1]].
+
+Methods:
+    - url(urlId): Returns the url string of an id.
+    - urls(): Returns every distinct url in id order.
+    - chunks(chunkSize): Yields urlId in views of at most chunkSize rows.
+"""
+class TraceCache:
+    def __init__(self, path):
+        self.path=path
+        self.seed=SEED
+        for name in COLUMNS:
+            setattr(self,name,np.load(os.path.join(path,name+".npy"),mmap_mode='r'))
+
+    def __len__(self):
+        return len(self.urlId)
+
+    def url(self, urlId):
+        return bytes(self.urlBytes[self.urlOffsets[urlId]:self.urlOffsets[urlId+1]]).decode("utf-8")
+
+    def urls(self):
+        return [self.url(urlId) for urlId in range(len(self.urlOffsets)-1)]
+
+    def chunks(self, chunkSize=4096):
+        for start in range(0,len(self.urlId),chunkSize):
+            yield self.urlId[start:start+chunkSize]
+
+"""
+    Returns the TraceCache of a DS1 trace csv, building it first when it is missing or older than the csv.
+    """
+def loadCache(csvPath, cacheDir=None):
+    path=cachePath(csvPath,cacheDir)
+    stamp=os.path.join(path,COLUMNS[-1]+".npy")
+    if not os.path.exists(stamp) or os.path.getmtime(stamp)<os.path.getmtime(csvPath):
+        buildCache(csvPath,cacheDir)
+    return TraceCache(path)
@@ -0,0 +1,161 @@
+import collections
+import csv
+import heapq
+import itertools
+import random
+
+"""
+Represents one row of the DS1 browsing history traces (TrainingHistory.csv, TestingHistory.csv).
+
+Attributes:
+    - url (str): The requested url.
+    - firstTs, lastTs (int): Unix timestamps of the first and last visit.
+    - visitCount (int): Number of visits.
+    - duration (int): Time spent on the url.
+"""
+TraceRecord=collections.namedtuple("TraceRecord",["url","firstTs","lastTs","visitCount","duration"])
+
+"""
+    Yields the TraceRecord of every row of a DS1 trace, reading one row at a time. Rows that are empty or do not
+    parse are skipped, and at most limit records are yielded when limit is set.
+    """
+def readTrace(path, limit=None):
+    with open(path, 'r',errors="ignore") as file:
+        records=0
+        for row in csv.reader(file):
+            if limit is not None and records>=limit:
+                break
+            if len(row)<5:
+                continue
+            try:
+                record=TraceRecord(row[0],int(row[1]),int(row[2]),int(row[3]),int(row[4]))
+            except ValueError:
+                continue
+            records+=1
+            yield record
+
+"""
+    Yields one column of a csv file row by row, for files such as dataset.csv that do not follow the DS1 layout.
+    """
+def readColumn(path, column, limit=None):
+    with open(path, 'r',errors="ignore") as file:
+        values=(row[column] for row in csv.reader(file) if len(row)>column)
+        for value in itertools.islice(values,limit):
+            yield value
+
+"""
+    Groups any iterable (readTrace, readColumn, ...) into lists of at most chunkSize items, so a trace can be fed to
+    route_batch one chunk at a time without holding the whole trace in memory.
+    """
+def chunked(items, chunkSize=4096):
+    items=iter(items)
+    while True:
+        chunk=list(itertools.islice(items,chunkSize))
+        if not chunk:
+            return
+        yield chunk
+
+"""
+    Yields the DS1 trace at path as lists of at most chunkSize TraceRecords.
+    """
+def readChunks(path, chunkSize=4096, limit=None):
+    return chunked(readTrace(path,limit),chunkSize)
+
+"""
+Represents one request of an expanded trace: the url and the time it was made (None for shuffled streams).
+"""
+Visit=collections.namedtuple("Visit",["url","ts"])
+
+"""
+    Yields the visitCount visits of one record, spread evenly from firstTs to lastTs.
+    """
+def spreadVisits(record):
+    span=record.lastTs-record.firstTs
+    last=max(1,record.visitCount-1)
+    for visit in range(record.visitCount):
+        yield Visit(record.url,record.firstTs+span*visit//last)
+
+"""
+Represents a Fenwick (binary indexed) tree over non-negative counts, used to draw an index with probability
+proportional to its count in O(log n).
+
+Attributes:
+    - tree (list): Partial sums, 1-based.
+    - total (int): Sum of every count.
+
+Methods:
+    - add(index, delta): Adds delta to the count at index.
+    - find(target): Returns the index whose cumulative count range holds target, 0 <= target < total.
+"""
+class FenwickTree:
+    def __init__(self, counts):
+        self.tree=[0]+list(counts)
+        for i in range(1,len(self.tree)):
+            parent=i+(i&-i)
+            if parent<len(self.tree):
+                self.tree[parent]+=self.tree[i]
+        self.total=sum(counts)
+
+    def add(self, index, delta):
+        self.total+=delta
+        i=index+1
+        while i<len(self.tree):
+            self.tree[i]+=delta
+            i+=i&-i
+
+    def find(self, target):
+        position=0
+        step=1<<(len(self.tree).bit_length())
+        while step:
+            if position+step<len(self.tree) and self.tree[position+step]<=target:
+                position+=step
+                target-=self.tree[position]
+            step>>=1
+        return position
+
+"""
+    Expands trace records into one Visit per counted visit, so a url visited 543 times is requested 543 times.
+    order="time" merges every record's visits (spread over its firstTs..lastTs) into timestamp order with a heap;
+    order="shuffle" draws the next visit with probability proportional to the visits each url has left, which keeps
+    every url's count (and so the trace's skew) while interleaving them at random. Only the records and their
+    remaining counts are held, never the expanded stream.
+    """
+def expandVisits(records, order="time", seed=480):
+    records=[record for record in records if record.visitCount>0]
+    if order=="time":
+        for visit in heapq.merge(*[spreadVisits(record) for record in records],key=lambda visit:visit.ts):
+            yield visit
+        return
+    if order!="shuffle":
+        raise ValueError(f"unknown order {order!r}, expected 'time' or 'shuffle'")
+    rng=random.Random(seed)
+    remaining=FenwickTree([record.visitCount for record in records])
+    while remaining.total>0:
+        index=remaining.find(rng.randrange(remaining.total))
+        remaining.add(index,-1)
+        yield Visit(records[index].url,None)
+
+"""
+    Yields the expanded visits of a DS1 trace (see expandVisits) as lists of at most chunkSize Visits.
+    """
+def readVisits(path, order="time", chunkSize=4096, limit=None, seed=480):
+    return chunked(expandVisits(readTrace(path,limit),order,seed),chunkSize)
+
+"""
+    Routes every url of a DS1 trace through ring.route_batch, chunkSize requests at a time, and returns how many
+    requests were placed. With order set ("time" or "shuffle") every row is replayed visitCount times. Rings with a
+    clock (advanceClock) are also given the time of every request, firstTs of each row or the visit time, so their
+    ttl model runs over the trace's own time axis; shuffled visits carry no time and are routed without one.
+    """
+def replayTrace(ring, path, chunkSize=4096, limit=None, order=None):
+    chunks=readChunks(path,chunkSize,limit) if order is None else readVisits(path,order,chunkSize,limit)
+    timed=hasattr(ring,"advanceClock") and order!="shuffle"
+    placed=0
+    for chunk in chunks:
+        urls=[record.url for record in chunk]
+        if timed:
+            timestamps=[record.firstTs for record in chunk] if order is None else [visit.ts for visit in chunk]
+            placed+=int((ring.route_batch(urls,timestamps=timestamps)>=0).sum())
+        else:
+            placed+=int((ring.route_batch(urls)>=0).sum())
+    return placed
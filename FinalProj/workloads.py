@@ -0,0 +1,93 @@
+import mmh3
+import numpy as np
+
+SEED=480
+DAY=86400
+
+"""
+Synthetic request streams for stress-testing the routers past the size of the DS1 traces. Every generator is
+seeded, so the same arguments always give the same stream, and returns a numpy array of key ids; requestNames
+turns key ids into the request strings the routers hash, and replay feeds them to route_batch chunk by chunk.
+"""
+
+"""
+    Returns the cumulative popularity of keys ranked 0..keys-1 under a Zipf law with exponent alpha.
+    """
+def zipfCdf(keys, alpha):
+    weights=np.arange(1,keys+1,dtype=np.float64)**-alpha
+    cdf=np.cumsum(weights)
+    return cdf/cdf[-1]
+
+"""
+    Draws n keys out of keys distinct ones with Zipf popularity: key k is requested in proportion to 1/(k+1)^alpha.
+    """
+def zipf(n, keys, alpha=1.0, seed=SEED):
+    rng=np.random.default_rng(seed)
+    return np.searchsorted(zipfCdf(keys,alpha),rng.random(n),side="right").astype(np.int64)
+
+"""
+    Zipf stream whose hot keys move: the stream is split into phases and each phase rotates which keys are
+    popular by keys/phases, so the keys that were hot go cold at every boundary.
+    """
+def hotspotShift(n, keys, alpha=1.0, phases=4, seed=SEED):
+    ranks=zipf(n,keys,alpha,seed)
+    phase=np.arange(n,dtype=np.int64)*phases//max(1,n)
+    return (ranks+phase*(keys//phases))%keys
+
+"""
+    Zipf stream with a flash crowd: between start and start+length (fractions of the stream) share of the requests
+    go to one key, by default a key that was never requested before the crowd.
+    """
+def flashCrowd(n, keys, alpha=1.0, start=0.5, length=0.1, share=0.5, hotKey=None, seed=SEED):
+    stream=zipf(n,keys,alpha,seed)
+    rng=np.random.default_rng(seed+1)
+    window=np.arange(int(start*n),min(n,int((start+length)*n)))
+    crowd=window[rng.random(len(window))<share]
+    stream[crowd]=keys if hotKey is None else hotKey
+    return stream
+
+"""
+    Zipf stream with a diurnal arrival rate. Returns (keys, timestamps): the rate follows a sine wave over each
+    day, amplitude being how far it swings around its mean, and the timestamps cover days days from start.
+    """
+def diurnal(n, keys, alpha=1.0, days=1, amplitude=0.8, start=0, seed=SEED):
+    rng=np.random.default_rng(seed+2)
+    grid=np.linspace(0,days*DAY,days*1440+1)
+    rate=1+amplitude*np.sin(2*np.pi*grid/DAY)
+    intensity=np.concatenate(([0],np.cumsum((rate[1:]+rate[:-1])/2)))
+    # arrival times are uniform draws warped through the inverse of the cumulative rate
+    arrivals=np.sort(rng.random(n))*intensity[-1]
+    timestamps=start+np.interp(arrivals,intensity,grid)
+    return zipf(n,keys,alpha,seed),timestamps.astype(np.int64)
+
+"""
+    Adversarial stream: n requests spread over distinct keys that all hash to slot modulo modulus, so they land
+    on one ring slot (modulus=totalNodes for ConsistentHashRing, 2*totalCapacity for the SPOCA key space).
+    hashSeed must be the SEED of the router being attacked (480 for 480Final.py, 500 for spoca.py), seed only
+    drives the order the keys are drawn in.
+    """
+def collisions(n, distinct, modulus, slot=0, prefix="key", seed=SEED, hashSeed=SEED):
+    found=[]
+    candidate=0
+    while len(found)<distinct:
+        if mmh3.hash(f"{prefix}{candidate}",hashSeed)%modulus==slot:
+            found.append(candidate)
+        candidate+=1
+    rng=np.random.default_rng(seed+3)
+    return np.array(found,dtype=np.int64)[rng.integers(0,distinct,n)]
+
+"""
+    Returns the request string of every key id, prefix followed by the id.
+    """
+def requestNames(keys, prefix="key"):
+    return np.char.add(prefix,np.asarray(keys).astype(str)).tolist()
+
+"""
+    Routes a key stream through ring.route_batch (ConsistentHashRing, SPOCA and the other engines all take a list
+    of request strings), chunkSize keys at a time, and returns how many requests were placed.
+    """
+def replay(ring, keys, chunkSize=65536, prefix="key"):
+    placed=0
+    for begin in range(0,len(keys),chunkSize):
+        placed+=int((ring.route_batch(requestNames(keys[begin:begin+chunkSize],prefix))>=0).sum())
+    return placed